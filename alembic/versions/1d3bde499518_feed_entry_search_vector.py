@@ -0,0 +1,78 @@
+"""feed entry search vector
+
+Revision ID: 1d3bde499518
+Revises: da5648c6ae93
+Create Date: 2026-10-18 20:37:07.083978
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '1d3bde499518'
+down_revision: Union[str, None] = 'da5648c6ae93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english'::regconfig, "
+    "coalesce({row}title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, "
+    "coalesce({row}summary, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, "
+    "coalesce(nullif({row}description, {row}summary), '')), 'C')"
+)
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    # a nullable column without a default is added without rewriting the
+    # table, a generated column would lock it for the whole rewrite
+    op.add_column('feedentry', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(
+        'CREATE OR REPLACE FUNCTION feedentry_search_vector() '
+        'RETURNS trigger AS $$ BEGIN '
+        f'NEW.search_vector := {SEARCH_VECTOR_EXPRESSION.format(row="NEW.")}; '
+        'RETURN NEW; '
+        'END $$ LANGUAGE plpgsql'
+    )
+    op.execute(
+        'CREATE TRIGGER feedentry_search_vector '
+        'BEFORE INSERT OR UPDATE OF title, summary, description ON feedentry '
+        'FOR EACH ROW EXECUTE FUNCTION feedentry_search_vector()'
+    )
+
+    with op.get_context().autocommit_block():
+        # entries stored from now on get their vector from the trigger,
+        # the ones before it are filled in one short transaction per batch
+        connection = op.get_bind()
+        max_id = connection.execute(
+            sa.text('SELECT coalesce(max(id), 0) FROM feedentry')
+        ).scalar()
+        for start_id in range(0, max_id, BACKFILL_BATCH_SIZE):
+            connection.execute(
+                sa.text(
+                    'UPDATE feedentry SET search_vector = '
+                    f'{SEARCH_VECTOR_EXPRESSION.format(row="")} '
+                    'WHERE id > :start_id AND id <= :end_id '
+                    'AND search_vector IS NULL'
+                ),
+                {
+                    'start_id': start_id,
+                    'end_id': start_id + BACKFILL_BATCH_SIZE,
+                },
+            )
+
+        op.create_index('ix_feedentry_search_vector', 'feedentry', ['search_vector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_feedentry_search_vector', table_name='feedentry', postgresql_using='gin')
+    op.execute('DROP TRIGGER feedentry_search_vector ON feedentry')
+    op.execute('DROP FUNCTION feedentry_search_vector()')
+    op.drop_column('feedentry', 'search_vector')
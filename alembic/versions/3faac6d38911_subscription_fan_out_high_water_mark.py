@@ -0,0 +1,83 @@
+"""subscription fan out high water mark
+
+Revision ID: 3faac6d38911
+Revises: 4f4bb5f795a4
+Create Date: 2026-10-18 19:54:04.761865
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3faac6d38911'
+down_revision: Union[str, None] = '4f4bb5f795a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# same name postgres gives the unnamed constraint declared on the model
+CONSTRAINT_NAME = 'userfeedentry_subscription_id_feed_entry_id_key'
+
+
+def upgrade() -> None:
+    op.add_column('feedsubscription', sa.Column('last_entry_id', sa.Integer(), server_default='0', nullable=False))
+    # entries already copied to a subscription are below its mark
+    op.execute(
+        'UPDATE feedsubscription SET last_entry_id = copied.max_entry_id '
+        'FROM ('
+        '  SELECT subscription_id, max(feed_entry_id) AS max_entry_id '
+        '  FROM userfeedentry GROUP BY subscription_id'
+        ') AS copied '
+        'WHERE copied.subscription_id = feedsubscription.id'
+    )
+
+    # the former check-then-insert copied some entries more than once,
+    # the lowest id of each entry is kept with the flags of all copies
+    op.execute(
+        'UPDATE userfeedentry SET is_read = copies.is_read, '
+        '  is_favorite = copies.is_favorite, '
+        '  is_archived = copies.is_archived '
+        'FROM ('
+        '  SELECT min(id) AS id, bool_or(is_read) AS is_read, '
+        '    bool_or(is_favorite) AS is_favorite, '
+        '    bool_or(is_archived) AS is_archived '
+        '  FROM userfeedentry GROUP BY subscription_id, feed_entry_id '
+        '  HAVING count(*) > 1'
+        ') AS copies '
+        'WHERE userfeedentry.id = copies.id'
+    )
+    op.execute(
+        'DELETE FROM userfeedentry AS duplicate USING userfeedentry AS kept '
+        'WHERE duplicate.subscription_id = kept.subscription_id '
+        '  AND duplicate.feed_entry_id = kept.feed_entry_id '
+        '  AND duplicate.id > kept.id'
+    )
+
+    with op.get_context().autocommit_block():
+        # a failed concurrent build leaves an invalid index behind
+        op.drop_index(
+            CONSTRAINT_NAME,
+            table_name='userfeedentry',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            CONSTRAINT_NAME,
+            'userfeedentry',
+            ['subscription_id', 'feed_entry_id'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+    op.execute(
+        f'ALTER TABLE userfeedentry ADD CONSTRAINT {CONSTRAINT_NAME} '
+        f'UNIQUE USING INDEX {CONSTRAINT_NAME}'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(CONSTRAINT_NAME, 'userfeedentry', type_='unique')
+    op.drop_column('feedsubscription', 'last_entry_id')
@@ -0,0 +1,71 @@
+"""unique guid per feed
+
+Revision ID: 4f4bb5f795a4
+Revises: 55fa5d85b7a6
+Create Date: 2026-10-18 19:52:47.548356
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f4bb5f795a4'
+down_revision: Union[str, None] = '55fa5d85b7a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# same name postgres gives the unnamed constraint declared on the model
+CONSTRAINT_NAME = 'feedentry_feed_id_guid_key'
+
+
+def upgrade() -> None:
+    # racing ingestions stored some entries more than once, the lowest id
+    # of each guid is kept and the user entries pointing at the other
+    # ones are moved over to it
+    op.execute(
+        'UPDATE userfeedentry SET feed_entry_id = kept.id '
+        'FROM feedentry AS duplicate JOIN ('
+        '  SELECT feed_id, guid, min(id) AS id FROM feedentry '
+        '  GROUP BY feed_id, guid HAVING count(*) > 1'
+        ') AS kept ON kept.feed_id = duplicate.feed_id '
+        '  AND kept.guid = duplicate.guid '
+        'WHERE userfeedentry.feed_entry_id = duplicate.id '
+        '  AND duplicate.id <> kept.id'
+    )
+    op.execute(
+        'DELETE FROM feedentry AS duplicate USING feedentry AS kept '
+        'WHERE duplicate.feed_id = kept.feed_id '
+        '  AND duplicate.guid = kept.guid '
+        '  AND duplicate.id > kept.id'
+    )
+
+    # build the index without locking writes on a large table, then
+    # promote it to the constraint the model declares
+    with op.get_context().autocommit_block():
+        # a failed concurrent build leaves an invalid index behind
+        op.drop_index(
+            CONSTRAINT_NAME,
+            table_name='feedentry',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            CONSTRAINT_NAME,
+            'feedentry',
+            ['feed_id', 'guid'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+    op.execute(
+        f'ALTER TABLE feedentry ADD CONSTRAINT {CONSTRAINT_NAME} '
+        f'UNIQUE USING INDEX {CONSTRAINT_NAME}'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(CONSTRAINT_NAME, 'feedentry', type_='unique')
@@ -0,0 +1,33 @@
+"""feed entry last seen
+
+Revision ID: efaab2782e30
+Revises: 60bb3c760b4a
+Create Date: 2026-10-18 21:04:37.808548
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'efaab2782e30'
+down_revision: Union[str, None] = '60bb3c760b4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # existing entries are left unstamped instead of taking the migration
+    # time from a column default, the default only applies to new rows
+    op.add_column('feedentry', sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True))
+    op.alter_column('feedentry', 'last_seen_at', server_default=sa.text('now()'))
+    # retention skips feeds with no stamped entries, dropping the cached
+    # validators has the next poll of every feed parse its document again
+    op.execute('UPDATE feed SET etag = NULL, last_modified = NULL, content_hash = NULL')
+
+
+def downgrade() -> None:
+    op.drop_column('feedentry', 'last_seen_at')
@@ -0,0 +1,101 @@
+import logging
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+import redis
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+
+from app.redis_client import redis_client
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def get_user_cache_version_key(user_id: int) -> str:
+    return f"user-cache-version:{user_id}"
+
+
+def get_user_cache_key(user_id: int, version: int, name: str) -> str:
+    return f"user-cache:{user_id}:{version}:{name}"
+
+
+async def read_through_user_cache(
+    user_id: int,
+    name: str,
+    adapter: TypeAdapter[T],
+    load: Callable[[], Awaitable[T]],
+) -> T:
+    """
+    Returns the user's cached value, or loads it and caches it for
+    user_cache_ttl_seconds. Values are kept under the user's current cache
+    version, so a value loaded before invalidate_user_caches bumped the
+    version can never be read afterwards. Loads from the database directly
+    when Redis is not available. The Redis client is blocking, its calls
+    run on the thread pool so that a slow Redis holds a thread instead of
+    the event loop.
+    """
+    key, cached = await run_in_threadpool(get_user_cache_entry, user_id, name)
+    if cached is not None:
+        return adapter.validate_json(cached)
+
+    value = await load()
+    if key is not None:
+        await run_in_threadpool(
+            set_user_cache_entry,
+            key,
+            adapter.dump_json(value),
+        )
+    return value
+
+
+def get_user_cache_entry(
+    user_id: int,
+    name: str,
+) -> tuple[str | None, bytes | None]:
+    """
+    Returns the key of the value under the user's current cache version
+    and the cached value, if any. The key is None when Redis is not
+    available.
+    """
+    try:
+        version = redis_client.get(get_user_cache_version_key(user_id))
+        key = get_user_cache_key(user_id, int(version or 0), name)
+        return key, redis_client.get(key)
+    except redis.RedisError:
+        logger.warning("User cache is not available, reading the database")
+        return None, None
+
+
+def set_user_cache_entry(key: str, value: bytes):
+    try:
+        redis_client.set(key, value, ex=settings.user_cache_ttl_seconds)
+    except redis.RedisError:
+        logger.warning("Could not cache %s", key)
+
+
+def invalidate_user_caches(user_ids: Iterable[int]):
+    """
+    Moves the users to a new cache version, values cached so far expire on
+    their own. Called after changes to the users' entries are committed.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    try:
+        with redis_client.pipeline(transaction=False) as pipeline:
+            for user_id in user_ids:
+                # versions never expire, a reset could revive old values
+                pipeline.incr(get_user_cache_version_key(user_id))
+            pipeline.execute()
+    except redis.RedisError:
+        # stale values are served until user_cache_ttl_seconds passes
+        logger.warning("Could not invalidate the caches of users %s", user_ids)
+
+
+async def invalidate_user_caches_async(user_ids: Iterable[int]):
+    """invalidate_user_caches of async endpoints, on the thread pool"""
+    await run_in_threadpool(invalidate_user_caches, user_ids)
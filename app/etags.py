@@ -0,0 +1,61 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+
+# responses differ per user, clients and private caches revalidate them
+CACHE_CONTROL = "private, no-cache"
+
+
+# weak validator of a response built from the given version markers
+def make_weak_etag(*version_markers) -> str:
+    raw = ":".join(str(marker) for marker in version_markers)
+    digest = hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+# If-None-Match uses the weak comparison, W/ prefixes are ignored
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag
+        for tag in if_none_match.split(",")
+    )
+
+
+def get_not_modified_response(
+    request: Request,
+    response: Response,
+    *version_markers,
+) -> Response | None:
+    """
+    Returns a 304 response when the client already has the version the
+    markers describe. Otherwise sets the ETag on the response the endpoint
+    goes on to build, and returns None.
+
+    usage:
+        not_modified = get_not_modified_response(request, response, "feeds")
+        if not_modified:
+            return not_modified
+    """
+    # one version of the data has a representation per path and query
+    etag = make_weak_etag(
+        request.url.path,
+        request.url.query,
+        *version_markers,
+    )
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=headers,
+        )
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,391 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from itertools import batched, pairwise
+from time import mktime
+from typing import Iterator, NamedTuple, Optional
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+
+import feedparser
+from feedparser.sanitizer import _sanitize_html
+
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+RSS1_NS = "{http://purl.org/rss/1.0/}"
+RDF_NS = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+DC_NS = "{http://purl.org/dc/elements/1.1/}"
+SY_NS = "{http://purl.org/rss/1.0/modules/syndication/}"
+
+ENTRY_TAGS = {"item", f"{RSS1_NS}item", f"{ATOM_NS}entry"}
+# feed level elements used by app.scheduling, with the keys feedparser uses
+FEED_INFO_TAGS = {
+    "ttl": "ttl",
+    f"{SY_NS}updatePeriod": "sy_updateperiod",
+    f"{SY_NS}updateFrequency": "sy_updatefrequency",
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FeedParseError(Exception):
+    """The document is not a feed, or not one the stream parser reads"""
+
+
+class ParsedEntry(NamedTuple):
+    """FeedEntry column values of one feed item"""
+    guid: str
+    title: str
+    link: str
+    description: Optional[str]
+    summary: Optional[str]
+    publish_date: Optional[datetime]
+
+
+class ParseJob(NamedTuple):
+    """What the parse stage needs of a fetched document"""
+    content: bytes
+    # lowercased response headers
+    headers: dict[str, str]
+    truncated: bool
+    # guids most recently stored for the feed, reaching one of them ends
+    # the parse early
+    known_guids: frozenset[str]
+
+
+class ParsedFeed(NamedTuple):
+    entries: list[ParsedEntry]
+    # feed level elements used by app.scheduling
+    feed_info: dict
+    # of all entries read, including known ones
+    publish_dates: list[Optional[datetime]]
+    guids: list[str]
+
+
+class FeedStream:
+    """
+    Reads the entries of an RSS 2.0, RSS 1.0 or Atom document one at a time
+    without building the whole tree. Every entry is dropped from the tree
+    once it is read, so memory stays flat however long the document is,
+    and the caller can stop reading as soon as it has what it needs.
+    Documents in other formats raise FeedParseError before the first entry,
+    these are left to feedparser.
+
+    usage:
+        stream = FeedStream(content, base_url)
+        for entry in stream.entries():
+            ...
+        stream.feed_info  # ttl etc. seen so far
+    """
+
+    def __init__(
+        self,
+        content: bytes,
+        base_url: Optional[str] = None,
+        truncated: bool = False,
+    ):
+        self.content = content
+        self.base_url = base_url
+        # a truncated document is read up to its last complete entry
+        self.truncated = truncated
+        self.feed_info: dict[str, str] = {}
+
+    def entries(self) -> Iterator[ParsedEntry]:
+        parser = ElementTree.XMLPullParser(events=("start", "end"))
+        parents = []
+
+        for offset in range(0, len(self.content), CHUNK_SIZE):
+            try:
+                parser.feed(self.content[offset:offset + CHUNK_SIZE])
+                events = list(parser.read_events())
+            except ElementTree.ParseError as error:
+                if self.truncated:
+                    return
+                raise FeedParseError(str(error)) from error
+
+            for event, element in events:
+                if event == "start":
+                    if not parents:
+                        check_root_tag(element.tag)
+                    parents.append(element)
+                    continue
+
+                parents.pop()
+
+                if element.tag in ENTRY_TAGS:
+                    entry = self.get_entry(element)
+                    # read entries are not needed in the tree any more
+                    parents[-1].remove(element)
+                    if entry:
+                        yield entry
+                elif (
+                    element.tag in FEED_INFO_TAGS
+                    and len(parents) <= 2
+                    and element.text
+                ):
+                    self.feed_info[FEED_INFO_TAGS[element.tag]] = (
+                        element.text.strip()
+                    )
+
+        if not self.truncated:
+            try:
+                parser.close()
+            except ElementTree.ParseError as error:
+                raise FeedParseError(str(error)) from error
+
+    def get_entry(self, element: ElementTree.Element) -> ParsedEntry | None:
+        if element.tag == f"{ATOM_NS}entry":
+            values = get_atom_entry_values(element)
+        else:
+            values = get_rss_entry_values(element)
+
+        link = values["link"] and urljoin(self.base_url or "", values["link"])
+        guid = values["guid"] or link
+
+        # entries that can not be told apart are skipped, like feedparser
+        # entries without an id fail ingestion
+        if not guid or not link:
+            return None
+
+        summary = values["summary"] and _sanitize_html(
+            values["summary"], "utf-8", "text/html",
+        )
+        return ParsedEntry(
+            guid=guid,
+            title=values["title"] or "",
+            link=link,
+            description=summary,
+            summary=summary,
+            publish_date=values["publish_date"],
+        )
+
+
+def parse_feed(
+    job: ParseJob,
+    max_entries: int,
+    chunk_size: int,
+) -> ParsedFeed:
+    """
+    Reads the entries of the document in chunks and stops at the first
+    chunk that reaches a known guid, or once max_entries entries are
+    found. Parse time grows with the number of new entries instead of the
+    size of the document. Known entries are left out of the result, but
+    entries older than the known guids may still be stored already.
+    Does no I/O, so that it can run in a process pool.
+    """
+    stream = FeedStream(
+        job.content,
+        base_url=job.headers.get("content-location"),
+        truncated=job.truncated,
+    )
+    entries = []
+    publish_dates = []
+    guids = []
+
+    try:
+        for chunk in batched(stream.entries(), chunk_size):
+            publish_dates.extend(entry.publish_date for entry in chunk)
+            guids.extend(entry.guid for entry in chunk)
+            new_entries = [
+                entry for entry in chunk if entry.guid not in job.known_guids
+            ]
+            entries.extend(new_entries)
+
+            if len(entries) >= max_entries:
+                break
+            # feeds listing their oldest entries first are read to the end
+            if len(new_entries) < len(chunk) and is_newest_first(chunk):
+                break
+    except FeedParseError:
+        # formats the stream parser does not read, e.g. Atom 0.3
+        return parse_feed_document(job, max_entries)
+
+    return ParsedFeed(
+        entries[:max_entries],
+        stream.feed_info,
+        publish_dates,
+        guids,
+    )
+
+
+def parse_feed_document(job: ParseJob, max_entries: int) -> ParsedFeed:
+    """Parses the whole document with feedparser"""
+    parser = feedparser.parse(job.content, response_headers=job.headers)
+
+    if parser.bozo:
+        raise FeedParseError("Something is wrong with the feed")
+
+    entries = [get_feedparser_entry(entry) for entry in parser.entries]
+    new_entries = [
+        entry for entry in entries if entry.guid not in job.known_guids
+    ]
+    return ParsedFeed(
+        new_entries[:max_entries],
+        dict(parser.feed),
+        [entry.publish_date for entry in entries],
+        [entry.guid for entry in entries],
+    )
+
+
+def get_feedparser_entry(entry: feedparser.FeedParserDict) -> ParsedEntry:
+    published_parsed = entry.get("published_parsed")
+
+    return ParsedEntry(
+        guid=entry.id,
+        title=entry.title,
+        link=entry.link,
+        description=entry.get("description"),
+        summary=entry.get("summary"),
+        publish_date=(
+            datetime.fromtimestamp(mktime(published_parsed))
+            if published_parsed
+            else None
+        ),
+    )
+
+
+def is_newest_first(entries: list[ParsedEntry]) -> bool:
+    # undated feeds, or ones dated alike, may append new entries at the end
+    publish_dates = [
+        entry.publish_date for entry in entries if entry.publish_date
+    ]
+    return (
+        len(publish_dates) >= 2
+        and publish_dates[0] > publish_dates[-1]
+        and all(newer >= older for newer, older in pairwise(publish_dates))
+    )
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor(processes: int) -> ProcessPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        # forkserver children do not inherit the database connections
+        _executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _executor
+
+
+def parse_feeds(
+    jobs: list[ParseJob],
+    processes: int = 0,
+    **parse_options,
+) -> list[ParsedFeed | BaseException]:
+    """
+    Parses the documents on a pool of processes, so that parsing a batch
+    uses all cores instead of one. With processes set to 0 they are
+    parsed in the current process. So are they in daemonic processes,
+    like the ones of Celery's default prefork pool, which may not have
+    children. Results are in the same order as the given jobs, failures
+    are returned in place instead of being raised.
+    """
+    global _executor
+
+    if processes <= 0 or multiprocessing.current_process().daemon:
+        return [run_parse_job(job, **parse_options) for job in jobs]
+
+    executor = get_executor(processes)
+    futures = [
+        executor.submit(parse_feed, job, **parse_options) for job in jobs
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool as error:
+            # a child died, start a new pool for the next batch
+            _executor = None
+            results.append(error)
+        except Exception as error:
+            results.append(error)
+
+    return results
+
+
+def run_parse_job(job: ParseJob, **parse_options) -> ParsedFeed | Exception:
+    try:
+        return parse_feed(job, **parse_options)
+    except Exception as error:
+        return error
+
+
+def check_root_tag(tag: str):
+    if tag not in ("rss", f"{RDF_NS}RDF", f"{ATOM_NS}feed"):
+        raise FeedParseError(f"Unsupported root element {tag}")
+
+
+def get_text(element: ElementTree.Element, tag: str) -> Optional[str]:
+    child = element.find(tag)
+    if child is None:
+        return None
+
+    text = "".join(child.itertext()).strip()
+    return text or None
+
+
+def get_rss_entry_values(element: ElementTree.Element) -> dict:
+    # RSS 1.0 puts its elements in a namespace, RSS 2.0 does not
+    ns = RSS1_NS if element.tag.startswith(RSS1_NS) else ""
+    published = get_text(element, "pubDate")
+
+    return {
+        "guid": get_text(element, "guid") or element.get(f"{RDF_NS}about"),
+        "title": get_text(element, f"{ns}title"),
+        "link": get_text(element, f"{ns}link"),
+        "summary": get_text(element, f"{ns}description"),
+        "publish_date": (
+            parse_rfc822_date(published)
+            if published
+            else parse_iso_date(get_text(element, f"{DC_NS}date"))
+        ),
+    }
+
+
+def get_atom_entry_values(element: ElementTree.Element) -> dict:
+    link = None
+    for link_element in element.iterfind(f"{ATOM_NS}link"):
+        if link_element.get("rel", "alternate") == "alternate":
+            link = link_element.get("href")
+            break
+
+    return {
+        "guid": get_text(element, f"{ATOM_NS}id"),
+        "title": get_text(element, f"{ATOM_NS}title"),
+        "link": link,
+        # feedparser falls back to the content when there is no summary
+        "summary": (
+            get_text(element, f"{ATOM_NS}summary")
+            or get_text(element, f"{ATOM_NS}content")
+        ),
+        "publish_date": parse_iso_date(
+            get_text(element, f"{ATOM_NS}published"),
+        ),
+    }
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    # publish dates are stored naive, in UTC
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_rfc822_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return to_naive_utc(parsedate_to_datetime(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_iso_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return to_naive_utc(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
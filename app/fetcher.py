@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+
+from app.models import Feed
+from settings import settings
+
+
+@dataclass
+class FetchResult:
+    """Raw outcome of fetching a feed document over HTTP"""
+    status_code: int
+    content: bytes = b""
+    # header names are lowercased
+    headers: dict[str, str] = field(default_factory=dict)
+    # the document was cut off at settings.feed_fetch_max_bytes
+    truncated: bool = False
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("etag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("last-modified")
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.content).hexdigest()
+
+
+def get_conditional_headers(feed: Feed) -> dict[str, str]:
+    headers = {"User-Agent": settings.feed_fetch_user_agent}
+
+    if feed.etag:
+        headers["If-None-Match"] = feed.etag
+    if feed.last_modified:
+        headers["If-Modified-Since"] = feed.last_modified
+
+    return headers
+
+
+def build_fetch_result(
+    response: httpx.Response,
+    content: bytes = b"",
+    truncated: bool = False,
+) -> FetchResult:
+    headers = {key.lower(): value for key, value in response.headers.items()}
+    # lets feedparser resolve relative links against the final url
+    headers.setdefault("content-location", str(response.url))
+
+    if response.status_code == 304:
+        return FetchResult(status_code=304, headers=headers)
+
+    response.raise_for_status()
+    return FetchResult(
+        status_code=response.status_code,
+        content=content,
+        headers=headers,
+        truncated=truncated,
+    )
+
+
+class CappedBuffer:
+    """
+    Collects a response body up to settings.feed_fetch_max_bytes, the
+    rest of an oversized document is never downloaded.
+    """
+
+    def __init__(self, max_bytes: int | None = None):
+        self.max_bytes = max_bytes or settings.feed_fetch_max_bytes
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    def append(self, chunk: bytes) -> bool:
+        """Returns False once the cap is reached"""
+        if self.size + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.size]
+            self.truncated = True
+
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        return not self.truncated
+
+    @property
+    def content(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+def read_response(response: httpx.Response) -> FetchResult:
+    buffer = CappedBuffer()
+    if response.is_success:
+        for chunk in response.iter_bytes():
+            if not buffer.append(chunk):
+                break
+
+    return build_fetch_result(response, buffer.content, buffer.truncated)
+
+
+def fetch_feed(feed: Feed, client: httpx.Client | None = None) -> FetchResult:
+    """
+    Fetches the feed document, sending the validators stored on the feed
+    so that unchanged feeds can be answered with a 304 by the origin.
+    Raises httpx.HTTPError on network failures and 4xx/5xx responses.
+    """
+    if client is None:
+        with httpx.Client(
+            timeout=settings.feed_fetch_timeout_seconds,
+            follow_redirects=True,
+        ) as client:
+            return fetch_feed(feed, client)
+
+    with client.stream(
+        "GET",
+        feed.feed_url,
+        headers=get_conditional_headers(feed),
+    ) as response:
+        return read_response(response)
+
+
+class AsyncFeedFetcher:
+    """
+    Fetches many feeds concurrently over one pooled keep-alive client.
+    In-flight requests are capped both globally and per origin host, so a
+    batch can wait on many slow origins at once without hammering any of them.
+
+    usage:
+        async with AsyncFeedFetcher() as fetcher:
+            results = await fetcher.fetch_many(feeds)
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_connections_per_host: int | None = None,
+        timeout: float | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.max_connections = (
+            max_connections or settings.feed_fetch_max_connections
+        )
+        self.max_connections_per_host = (
+            max_connections_per_host
+            or settings.feed_fetch_max_connections_per_host
+        )
+        self.timeout = timeout or settings.feed_fetch_timeout_seconds
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._global_semaphore = asyncio.Semaphore(self.max_connections)
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncFeedFetcher":
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+            follow_redirects=True,
+            transport=self._transport,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._client.aclose()
+        self._client = None
+
+    def _get_host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(
+                self.max_connections_per_host,
+            )
+        return self._host_semaphores[host]
+
+    async def fetch(self, feed: Feed) -> FetchResult:
+        # the host slot is taken first so that feeds waiting on a busy
+        # origin do not hold global slots other hosts could use
+        async with self._get_host_semaphore(feed.feed_url):
+            async with self._global_semaphore:
+                async with asyncio.timeout(self.timeout):
+                    return await self._read(feed)
+
+    async def _read(self, feed: Feed) -> FetchResult:
+        async with self._client.stream(
+            "GET",
+            feed.feed_url,
+            headers=get_conditional_headers(feed),
+        ) as response:
+            buffer = CappedBuffer()
+            if response.is_success:
+                async for chunk in response.aiter_bytes():
+                    if not buffer.append(chunk):
+                        break
+
+            return build_fetch_result(
+                response, buffer.content, buffer.truncated,
+            )
+
+    async def fetch_many(
+        self,
+        feeds: list[Feed],
+    ) -> list[FetchResult | BaseException]:
+        """
+        Results are in the same order as the given feeds, failures are
+        returned in place instead of being raised.
+        """
+        return await asyncio.gather(
+            *(self.fetch(feed) for feed in feeds),
+            return_exceptions=True,
+        )
+
+
+async def fetch_feeds(
+    feeds: list[Feed],
+    **fetcher_options,
+) -> list[FetchResult | BaseException]:
+    async with AsyncFeedFetcher(**fetcher_options) as fetcher:
+        return await fetcher.fetch_many(feeds)
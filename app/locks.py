@@ -0,0 +1,118 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from uuid import uuid4
+
+import redis
+from celery.utils.log import get_task_logger
+
+from app.redis_client import redis_client
+from settings import settings
+
+
+logger = get_task_logger(__name__)
+
+
+def get_feed_lock_key(feed_id: int) -> str:
+    return f"feed-lock:{feed_id}"
+
+
+def acquire_feed_locks(feed_ids: list[int], token: str) -> list[int]:
+    """
+    Locks the feeds that no other worker is updating, in one round trip,
+    and returns them. The ttl frees a feed if its holder dies without
+    releasing it. Without Redis every caller gets to update every feed,
+    as before locking was added.
+    """
+    try:
+        with redis_client.pipeline() as pipeline:
+            for feed_id in feed_ids:
+                pipeline.set(
+                    get_feed_lock_key(feed_id),
+                    token,
+                    nx=True,
+                    ex=settings.feed_lock_ttl_seconds,
+                )
+            acquired = pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not lock feeds %s, updating anyway", feed_ids)
+        return list(feed_ids)
+
+    return [
+        feed_id
+        for feed_id, is_acquired in zip(feed_ids, acquired)
+        if is_acquired
+    ]
+
+
+def release_feed_locks(feed_ids: list[int], token: str):
+    """
+    Releases the locks still held with the token. Locks whose ttl expired
+    and that were taken over by another worker are left alone.
+    """
+    keys = [get_feed_lock_key(feed_id) for feed_id in feed_ids]
+
+    def release(pipeline: redis.client.Pipeline):
+        values = pipeline.mget(keys)
+        owned_keys = [
+            key
+            for key, value in zip(keys, values)
+            if value == token.encode()
+        ]
+        pipeline.multi()
+        if owned_keys:
+            pipeline.delete(*owned_keys)
+
+    if not keys:
+        return
+
+    try:
+        redis_client.transaction(release, *keys)
+    except redis.RedisError:
+        logger.warning("Could not release the locks of feeds %s", feed_ids)
+
+
+def wait_for_feed_updates(feed_ids: list[int]) -> bool:
+    """
+    Blocks until no worker is updating the feeds any more, at most
+    feed_lock_wait_seconds. Returns False if it gave up waiting.
+    """
+    keys = [get_feed_lock_key(feed_id) for feed_id in feed_ids]
+    deadline = time.monotonic() + settings.feed_lock_wait_seconds
+
+    try:
+        while keys and redis_client.exists(*keys):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+    except redis.RedisError:
+        return False
+
+    return True
+
+
+@contextmanager
+def single_flight(feed_id: int, wait: bool = False) -> Iterator[bool]:
+    """
+    Makes sure only one caller updates a feed at a time.
+    Yields True if the caller holds the feed and should update it. Yields
+    False if another caller is already updating it, after that update
+    finished if wait is set, right away otherwise.
+
+    usage:
+        with single_flight(feed.id) as is_owner:
+            if is_owner:
+                update_entries_for_feed(feed, session)
+    """
+    token = uuid4().hex
+
+    if not acquire_feed_locks([feed_id], token):
+        if wait:
+            wait_for_feed_updates([feed_id])
+        yield False
+        return
+
+    try:
+        yield True
+    finally:
+        release_feed_locks([feed_id], token)
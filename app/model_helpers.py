@@ -1,18 +1,72 @@
-from datetime import datetime
-from time import mktime
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
 from fastapi import Depends, HTTPException, status
+from pydantic import TypeAdapter
+from sqlalchemy import (
+    Integer,
+    and_,
+    column,
+    delete,
+    exists,
+    false,
+    func,
+    literal,
+    literal_column,
+    or_,
+    true,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 import feedparser
+import httpx
+
+from app.cache import invalidate_user_caches, read_through_user_cache
+from app.feed_parser import (
+    FeedParseError,
+    ParsedFeed,
+    ParseJob,
+    parse_feed,
+)
+from app.fetcher import FetchResult, fetch_feed
 
+from app.scheduling import (
+    compute_poll_interval,
+    compute_retry_poll_at,
+    compute_unchanged_poll_interval,
+    utc_now,
+)
 from app.models import (
     Feed,
+    FeedChangeEvent,
     FeedEntry,
+    FeedEntryArchive,
     FeedSubscription,
-    User,
     UserFeedEntry,
+    SEARCH_CONFIG,
+    get_async_db_session,
     get_db_session,
 )
-from app.schemas import FeedIn
+from app.schemas import (
+    FeedIn,
+    UnreadCountOut,
+    UnreadCountsOut,
+    UserFeedEntryOut,
+    UserFeedEntryPage,
+)
+from app.security import Principal
+from app.utils import (
+    decode_cursor,
+    decode_search_cursor,
+    encode_cursor,
+    encode_search_cursor,
+)
+from settings import settings
 
 
 def create_feed_in_database(
@@ -51,7 +105,7 @@ def create_feed_in_database(
 
 def create_feed_subscription_with_feed_id(
     feed_id: int,
-    user: User,
+    user: Principal,
     db_session: Session = Depends(get_db_session),
 ) -> FeedSubscription:
     statement = select(Feed).where(Feed.id == feed_id)
@@ -83,14 +137,18 @@ def create_feed_subscription_with_feed_id(
     )
     db_session.add(subscription)
     db_session.commit()
+    # the feed's existing entries are not fanned out again on their own,
+    # the next fan-out only covers entries stored from now on
+    update_subscription_entries(subscription, db_session)
     db_session.refresh(subscription)
+    invalidate_user_caches([user.id])
 
     return subscription
 
 
 def unscubscribe_from_feed(
     feed_id: int,
-    user: User,
+    user: Principal,
     db_session: Session = Depends(get_db_session),
 ):
     statement = select(FeedSubscription).where(
@@ -108,76 +166,1393 @@ def unscubscribe_from_feed(
 
     db_session.delete(subscription)
     db_session.commit()
+    invalidate_user_caches([user.id])
 
 
 def update_entries_for_feed(
     feed: Feed,
     db_session: Session = Depends(get_db_session),
-):
-    parser = feedparser.parse(feed.feed_url)
-
-    if parser.bozo:
+) -> int:
+    """
+    Fetches the feed and stores its new entries.
+    Returns the number of new entries.
+    """
+    try:
+        fetch_result = fetch_feed(feed)
+    except httpx.HTTPError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Something is wrong with the feed",
         )
 
-    for entry in parser.entries:
-        statement = select(FeedEntry).where(
-            FeedEntry.guid == entry.id,
+    return ingest_fetch_result(feed, fetch_result, db_session)
+
+
+def ingest_fetch_result(
+    feed: Feed,
+    fetch_result: FetchResult,
+    db_session: Session = Depends(get_db_session),
+) -> int:
+    """
+    Parses an already fetched feed document and stores its new entries.
+    Parsing and entry storage is skipped when the origin answered with
+    a 304 or served the same document as the previous poll, only the next
+    poll time of the feed is updated then.
+    Returns the number of new entries.
+    """
+    if skip_unchanged_fetch_result(feed, fetch_result, db_session):
+        return 0
+
+    job = get_parse_job(
+        fetch_result,
+        get_recent_guids([feed.id], db_session).get(feed.id, frozenset()),
+    )
+    try:
+        parsed_feed = parse_feed(job, **get_parse_options())
+    except FeedParseError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Something is wrong with the feed",
         )
-        results = db_session.exec(statement)
-        existing_entry = results.first()
 
-        if existing_entry:
-            continue
+    return store_parsed_feed(feed, fetch_result, parsed_feed, db_session)
+
+
+def skip_unchanged_fetch_result(
+    feed: Feed,
+    fetch_result: FetchResult,
+    db_session: Session = Depends(get_db_session),
+) -> bool:
+    """
+    Returns True if the document did not change since the previous poll,
+    after scheduling the next poll of the feed.
+    """
+    if (
+        not fetch_result.not_modified
+        and fetch_result.content_hash != feed.content_hash
+    ):
+        return False
+
+    schedule_next_poll(
+        feed,
+        compute_unchanged_poll_interval(
+            feed.poll_interval_seconds,
+            fetch_result.headers,
+        ),
+        db_session,
+    )
+    return True
+
+
+def get_parse_job(
+    fetch_result: FetchResult,
+    known_guids: frozenset[str],
+) -> ParseJob:
+    return ParseJob(
+        content=fetch_result.content,
+        headers=fetch_result.headers,
+        truncated=fetch_result.truncated,
+        known_guids=known_guids,
+    )
+
+
+def get_parse_options() -> dict:
+    return {
+        "max_entries": settings.feed_parse_max_entries,
+        "chunk_size": settings.feed_parse_chunk_size,
+    }
+
+
+def store_parsed_feed(
+    feed: Feed,
+    fetch_result: FetchResult,
+    parsed_feed: ParsedFeed,
+    db_session: Session = Depends(get_db_session),
+) -> int:
+    """
+    Persist stage of ingestion, stores the new entries of a parsed document
+    with one INSERT and schedules the next poll. Commits once.
+    Returns the number of new entries.
+    """
+    seen_at = utc_now()
+    mark_feed_entries_seen(feed, parsed_feed.guids, seen_at, db_session)
+    # documents list their newest entries first, storing them the other
+    # way around gives the newest entry the highest id
+    new_entry_count = store_new_feed_entries(
+        feed,
+        [
+            {**entry._asdict(), "last_seen_at": seen_at}
+            for entry in reversed(parsed_feed.entries)
+        ],
+        db_session,
+    )
+
+    feed.etag = fetch_result.etag
+    feed.last_modified = fetch_result.last_modified
+    feed.content_hash = fetch_result.content_hash
+    schedule_next_poll(
+        feed,
+        compute_poll_interval(
+            parsed_feed.publish_dates,
+            parsed_feed.feed_info,
+            fetch_result.headers,
+        ),
+        db_session,
+    )
+
+    return new_entry_count
+
+
+def get_recent_guids(
+    feed_ids: list[int],
+    db_session: Session = Depends(get_db_session),
+) -> dict[int, frozenset[str]]:
+    """
+    Returns the guids last stored for each of the feeds, with one query.
+    A document of a newest first feed reaches these right after its new
+    entries, which lets the parse stage stop without a database lookup.
+    """
+    recent_entries = select(FeedEntry.guid).where(
+        FeedEntry.feed_id == Feed.id,
+    ).order_by(
+        FeedEntry.created_at.desc(),
+        FeedEntry.id.desc(),
+    ).limit(settings.feed_parse_chunk_size).lateral()
+
+    statement = select(Feed.id, recent_entries.c.guid).join(
+        recent_entries,
+        true(),
+    ).where(Feed.id.in_(feed_ids))
+
+    guids_by_feed = {}
+    for feed_id, guid in db_session.exec(statement).all():
+        guids_by_feed.setdefault(feed_id, set()).add(guid)
+
+    return {
+        feed_id: frozenset(guids)
+        for feed_id, guids in guids_by_feed.items()
+    }
+
+
+def schedule_next_poll(
+    feed: Feed,
+    poll_interval_seconds: int,
+    db_session: Session = Depends(get_db_session),
+):
+    feed.poll_interval_seconds = poll_interval_seconds
+    feed.next_poll_at = utc_now() + timedelta(seconds=poll_interval_seconds)
+    db_session.add(feed)
+    db_session.commit()
+
+
+def schedule_retry_poll(
+    feed: Feed,
+    headers: Optional[dict[str, str]] = None,
+    db_session: Session = Depends(get_db_session),
+):
+    """Pushes the next poll back after a failed fetch or parse"""
+    feed.next_poll_at = compute_retry_poll_at(utc_now(), headers)
+    db_session.add(feed)
+    db_session.commit()
+
+
+def mark_feed_entries_seen(
+    feed: Feed,
+    guids: list[str],
+    seen_at: datetime,
+    db_session: Session = Depends(get_db_session),
+):
+    """
+    Stamps the stored entries the parsed document lists with seen_at, the
+    new entries of the document are stored with the same one. The entries
+    of a feed with its latest FeedEntry.last_seen_at are the ones its last
+    parsed document lists, retention keeps them since they would be stored
+    again as new entries. Does not commit.
+    """
+    if not guids:
+        return
+
+    statement = update(FeedEntry).where(
+        FeedEntry.feed_id == feed.id,
+        FeedEntry.guid.in_(guids),
+    ).values(last_seen_at=seen_at)
+    db_session.execute(statement)
+
+
+def get_known_guids(
+    feed: Feed,
+    guids: list[str],
+    db_session: Session = Depends(get_db_session),
+) -> set[str]:
+    """Returns the guids already stored for the feed"""
+    statement = select(FeedEntry.guid).where(
+        FeedEntry.feed_id == feed.id,
+        FeedEntry.guid.in_(guids),
+    )
+    results = db_session.exec(statement)
+    return set(results.all())
+
+
+def store_new_feed_entries(
+    feed: Feed,
+    entry_values: list[dict],
+    db_session: Session = Depends(get_db_session),
+) -> int:
+    """
+    Inserts the entries whose guid is not yet stored for the feed. Existing
+    guids are resolved with a single query on the (feed_id, guid) unique
+    index and the new rows are written in one INSERT that skips rows a
+    concurrent ingestion stored in the meantime. A FeedChangeEvent is
+    recorded along with the new rows.
+    Does not commit. Returns the number of new rows.
+    """
+    new_entries_by_guid = {}
+    for values in entry_values:
+        # a document may repeat an item, the first occurrence wins
+        new_entries_by_guid.setdefault(values["guid"], values)
+
+    if not new_entries_by_guid:
+        return 0
+
+    known_guids = get_known_guids(feed, list(new_entries_by_guid), db_session)
+    for known_guid in known_guids:
+        del new_entries_by_guid[known_guid]
+
+    if not new_entries_by_guid:
+        return 0
+
+    # known guids are filtered out up front since conflicting rows would
+    # still consume a value of the id sequence on every poll
+    statement = insert(FeedEntry).values(
+        [
+            {**values, "feed_id": feed.id}
+            for values in new_entries_by_guid.values()
+        ]
+    ).on_conflict_do_nothing(
+        index_elements=["feed_id", "guid"],
+    ).returning(FeedEntry.id)
+    results = db_session.execute(statement)
+    new_entry_ids = results.scalars().all()
 
-        feed_entry = FeedEntry(
+    if new_entry_ids:
+        db_session.add(FeedChangeEvent(
             feed_id=feed.id,
-            title=entry.title,
-            link=entry.link,
-            description=entry.description,
-            guid=entry.id,
-            summary=entry.summary,
-            publish_date=datetime.fromtimestamp(
-                mktime(entry.published_parsed)
-            ),
+            max_entry_id=max(new_entry_ids),
+        ))
+
+    return len(new_entry_ids)
+
+
+def fan_out_feed_entries(
+    feed_id: int,
+    db_session: Session = Depends(get_db_session),
+    subscription_ids: list[int] | None = None,
+) -> int:
+    """
+    Copies the entries of a feed that are newer than each subscription's
+    high-water mark (FeedSubscription.last_entry_id) into UserFeedEntry,
+    for all subscriptions of the feed with one INSERT ... SELECT, then
+    advances the marks and adds the new unread entries to the unread
+    counts. Pass subscription_ids to limit it to some of the
+    subscriptions. Commits once. Returns the number of new rows.
+    """
+    subscription_filters = [FeedSubscription.feed_id == feed_id]
+    if subscription_ids is not None:
+        subscription_filters.append(FeedSubscription.id.in_(subscription_ids))
+
+    # bounding both statements by the same id keeps entries committed in
+    # between from being skipped by the mark update
+    statement = select(func.max(FeedEntry.id)).where(
+        FeedEntry.feed_id == feed_id,
+    )
+    max_entry_id = db_session.exec(statement).one()
+
+    if max_entry_id is None:
+        return 0
+
+    inserted_count = 0
+    # with settings.lazy_read_state read state is derived from FeedEntry
+    # directly, there is nothing to copy, only the marks and counts move
+    if not settings.lazy_read_state:
+        new_entries = select(
+            FeedSubscription.id,
+            FeedEntry.id,
+            false(),
+            false(),
+            false(),
+        ).join(
+            FeedEntry,
+            FeedEntry.feed_id == FeedSubscription.feed_id,
+        ).where(
+            *subscription_filters,
+            FeedEntry.id > FeedSubscription.last_entry_id,
+            FeedEntry.id <= max_entry_id,
+        ).order_by(FeedSubscription.id, FeedEntry.id)
+
+        statement = insert(UserFeedEntry).from_select(
+            [
+                "subscription_id",
+                "feed_entry_id",
+                "is_read",
+                "is_favorite",
+                "is_archived",
+            ],
+            new_entries,
+        ).on_conflict_do_nothing(
+            index_elements=["subscription_id", "feed_entry_id"],
         )
-        db_session.add(feed_entry)
+        inserted_count = db_session.execute(statement).rowcount
+
+    # the subscriptions whose mark moves are the ones that got new entries,
+    # the count reads the marks from before the update
+    statement = update(FeedSubscription).where(
+        *subscription_filters,
+        FeedSubscription.last_entry_id < max_entry_id,
+    ).values(
+        unread_count=(
+            FeedSubscription.unread_count
+            + count_new_unread_entries(max_entry_id)
+        ),
+        entries_version=FeedSubscription.entries_version + 1,
+        last_entry_id=max_entry_id,
+    ).returning(FeedSubscription.user_id)
+    user_ids = db_session.execute(statement).scalars().all()
     db_session.commit()
+    invalidate_user_caches(user_ids)
+
+    return inserted_count
+
+
+def count_new_unread_entries(max_entry_id: int):
+    """
+    Correlated subquery counting the unread entries of a FeedSubscription
+    row above its high-water mark and up to max_entry_id.
+    """
+    if settings.lazy_read_state:
+        statement = select(func.count()).select_from(FeedEntry).outerjoin(
+            UserFeedEntry,
+            and_(
+                UserFeedEntry.subscription_id == FeedSubscription.id,
+                UserFeedEntry.feed_entry_id == FeedEntry.id,
+            ),
+        ).where(
+            FeedEntry.feed_id == FeedSubscription.feed_id,
+            FeedEntry.id > FeedSubscription.last_entry_id,
+            FeedEntry.id <= max_entry_id,
+            get_lazy_is_read_column() == False,  # noqa
+        )
+    else:
+        statement = select(func.count()).select_from(UserFeedEntry).where(
+            UserFeedEntry.subscription_id == FeedSubscription.id,
+            UserFeedEntry.feed_entry_id > FeedSubscription.last_entry_id,
+            UserFeedEntry.feed_entry_id <= max_entry_id,
+            UserFeedEntry.is_read == False,  # noqa
+        )
+
+    return statement.correlate(FeedSubscription).scalar_subquery()
+
+
+def fan_out_feed_changes(
+    db_session: Session = Depends(get_db_session),
+    limit: int = 1000,
+) -> int:
+    """
+    Fans out the entries of up to limit feeds that have pending change
+    events and removes those events, each feed in its own transaction.
+    Feeds without events are not touched, so this does nothing on an idle
+    system. Returns the number of feeds processed.
+    """
+    statement = select(FeedChangeEvent.feed_id).distinct().order_by(
+        FeedChangeEvent.feed_id,
+    ).limit(limit)
+    feed_ids = db_session.exec(statement).all()
+
+    for feed_id in feed_ids:
+        # events committed after this point are kept for the next run,
+        # the ones removed here are covered since the fan-out reads the
+        # newest entry id afterwards
+        statement = delete(FeedChangeEvent).where(
+            FeedChangeEvent.feed_id == feed_id,
+        )
+        db_session.execute(statement)
+        fan_out_feed_entries(feed_id, db_session)
+        db_session.commit()
+
+    return len(feed_ids)
 
 
 def update_subscription_entries(
     subscription: FeedSubscription,
     db_session: Session = Depends(get_db_session),
-):
+) -> int:
     """
     This function updates the entries for a specific subscription.
     """
+    return fan_out_feed_entries(
+        subscription.feed_id,
+        db_session,
+        subscription_ids=[subscription.id],
+    )
 
-    feed = subscription.feed
 
-    select_entries_statement = select(FeedEntry).where(
-        FeedEntry.feed_id == feed.id,
+def update_entries_for_subscriptions(
+    subscription_ids: list[int],
+    db_session: Session = Depends(get_db_session),
+) -> int:
+    """
+    Brings a batch of subscriptions up to date with one fan-out per feed
+    instead of one per subscription. Returns the number of new rows.
+    """
+    statement = select(FeedSubscription.feed_id, FeedSubscription.id).where(
+        FeedSubscription.id.in_(subscription_ids),
+    )
+    subscription_ids_by_feed = {}
+    for feed_id, subscription_id in db_session.exec(statement).all():
+        subscription_ids_by_feed.setdefault(feed_id, []).append(
+            subscription_id,
+        )
+
+    return sum(
+        fan_out_feed_entries(feed_id, db_session, subscription_ids=ids)
+        for feed_id, ids in subscription_ids_by_feed.items()
+    )
+
+
+def get_lazy_is_read_column():
+    """Read state of an entry when settings.lazy_read_state is enabled"""
+    return func.coalesce(
+        UserFeedEntry.is_read,
+        FeedEntry.id <= FeedSubscription.read_cursor_entry_id,
+    )
+
+
+def get_user_feed_entry_key_columns() -> tuple:
+    """
+    The (id, is_read, created_at) columns select_user_feed_entries uses
+    for the configured storage mode.
+    """
+    if settings.lazy_read_state:
+        return FeedEntry.id, get_lazy_is_read_column(), FeedEntry.created_at
+    return UserFeedEntry.id, UserFeedEntry.is_read, UserFeedEntry.created_at
+
+
+def select_user_feed_entries(user_id: int):
+    """
+    Selects the UserFeedEntryOut columns (and created_at for pagination) of
+    the user's entries with one joined query, so serializing a page does
+    not load any rows lazily.
+    """
+    return select_subscription_feed_entries().where(
+        FeedSubscription.user_id == user_id,
+    )
+
+
+def select_subscription_feed_entries():
+    """select_user_feed_entries of all subscriptions"""
+    id_column, is_read_column, created_at_column = (
+        get_user_feed_entry_key_columns()
+    )
+    statement = select(
+        id_column.label("id"),
+        is_read_column.label("is_read"),
+        created_at_column.label("created_at"),
+        FeedEntry.feed_id,
+        FeedEntry.title,
+        FeedEntry.description,
+        FeedEntry.summary,
+        FeedEntry.publish_date,
+    )
+
+    if settings.lazy_read_state:
+        # the sparse UserFeedEntry rows only override the read cursor
+        statement = statement.select_from(FeedSubscription).join(
+            FeedEntry,
+            FeedEntry.feed_id == FeedSubscription.feed_id,
+        ).outerjoin(
+            UserFeedEntry,
+            and_(
+                UserFeedEntry.subscription_id == FeedSubscription.id,
+                UserFeedEntry.feed_entry_id == FeedEntry.id,
+            ),
+        )
+    else:
+        statement = statement.select_from(UserFeedEntry).join(
+            FeedSubscription,
+            FeedSubscription.id == UserFeedEntry.subscription_id,
+        ).join(
+            FeedEntry,
+            FeedEntry.id == UserFeedEntry.feed_entry_id,
+        )
+
+    return statement
+
+
+def paginate_by_keyset(
+    statement,
+    keyset_columns: tuple,
+    cursor: str | None,
+    limit: int,
+    descending: bool = True,
+    decode: Callable[[str], tuple] = decode_cursor,
+):
+    """
+    Orders the statement by the keyset columns and continues after the row
+    the cursor was built from, so every page is an index range scan no
+    matter how deep it is. Selects one extra row to detect a next page.
+    """
+    if cursor:
+        try:
+            cursor_values = decode(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor.",
+            )
+
+        keyset = tuple_(*keyset_columns)
+        after_cursor = tuple_(*(literal(value) for value in cursor_values))
+        statement = statement.where(
+            keyset < after_cursor if descending else keyset > after_cursor
+        )
+
+    return statement.order_by(
+        *(
+            column.desc() if descending else column.asc()
+            for column in keyset_columns
+        )
+    ).limit(limit + 1)
+
+
+async def list_user_feed_entries(
+    user: Principal,
+    is_read: bool = False,
+    order_by_date_desc: bool = True,
+    db_session: AsyncSession = Depends(get_async_db_session),
+    limit: int = 50,
+    cursor: str | None = None,
+) -> UserFeedEntryPage:
+    """
+    Returns a page of the user's entries ordered by (created_at, id),
+    next_cursor continues after its last entry. The first page of unread
+    entries, which clients poll, is served from the user cache.
+    """
+    def load_page() -> Awaitable[UserFeedEntryPage]:
+        return db_session.run_sync(
+            lambda session: load_user_feed_entry_page(
+                user, is_read, order_by_date_desc, session, limit, cursor,
+            ),
+        )
+
+    if is_read or cursor is not None:
+        return await load_page()
+
+    order = "desc" if order_by_date_desc else "asc"
+    return await read_through_user_cache(
+        user.id,
+        f"unread-page:{get_read_state_mode()}:{order}:{limit}",
+        TypeAdapter(UserFeedEntryPage),
+        load_page,
+    )
+
+
+def load_user_feed_entry_page(
+    user: Principal,
+    is_read: bool,
+    order_by_date_desc: bool,
+    db_session: Session,
+    limit: int,
+    cursor: str | None,
+) -> UserFeedEntryPage:
+    id_column, is_read_column, created_at_column = (
+        get_user_feed_entry_key_columns()
+    )
+    statement = paginate_by_keyset(
+        select_user_feed_entries(user.id).where(is_read_column == is_read),
+        (created_at_column, id_column),
+        cursor,
+        limit,
+        descending=order_by_date_desc,
+    )
+    results = db_session.exec(statement)
+    rows = results.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        next_cursor = encode_cursor(last_row.created_at, last_row.id)
+
+    return UserFeedEntryPage(
+        items=[UserFeedEntryOut.model_validate(row) for row in rows[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+def search_user_feed_entries(
+    user: Principal,
+    query: str,
+    db_session: Session = Depends(get_db_session),
+    limit: int = 50,
+    cursor: str | None = None,
+) -> UserFeedEntryPage:
+    """
+    Returns a page of the user's entries matching the web search style
+    query, best matches first, next_cursor continues after its last entry.
+    Only the newest search_max_candidates matches are ranked, so a common
+    word costs the same as a rare one however many entries contain it.
+    """
+    ts_query = func.websearch_to_tsquery(
+        literal_column(f"'{SEARCH_CONFIG}'::regconfig"),
+        query,
     )
-    results = db_session.exec(select_entries_statement)
-    entries = results.all()
+    candidates = select_user_feed_entries(user.id).add_columns(
+        func.ts_rank_cd(FeedEntry.search_vector, ts_query).label("rank"),
+    ).where(
+        FeedEntry.search_vector.op("@@")(ts_query),
+    ).order_by(
+        FeedEntry.id.desc(),
+    ).limit(settings.search_max_candidates).subquery()
 
-    for entry in entries:
-        user_feed_entry_statement = select(UserFeedEntry).where(
-            UserFeedEntry.subscription_id == subscription.id,
-            UserFeedEntry.feed_entry_id == entry.id,
+    statement = paginate_by_keyset(
+        select(*candidates.c),
+        (candidates.c.rank, candidates.c.id),
+        cursor,
+        limit,
+        decode=decode_search_cursor,
+    )
+    results = db_session.exec(statement)
+    rows = results.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_row = rows[limit - 1]
+        next_cursor = encode_search_cursor(last_row.rank, last_row.id)
+
+    return UserFeedEntryPage(
+        items=[UserFeedEntryOut.model_validate(row) for row in rows[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+async def count_unread_user_feed_entries(
+    user: Principal,
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> UnreadCountsOut:
+    """Unread entries per subscription, served from the user cache"""
+    return await read_through_user_cache(
+        user.id,
+        "unread-counts",
+        TypeAdapter(UnreadCountsOut),
+        lambda: db_session.run_sync(
+            lambda session: load_unread_counts(user, session),
+        ),
+    )
+
+
+def load_unread_counts(
+    user: Principal,
+    db_session: Session = Depends(get_db_session),
+) -> UnreadCountsOut:
+    """
+    Reads the counters maintained on FeedSubscription, one row per
+    subscription whatever the number of entries. Entries stored since
+    the last fan-out of a feed are not counted yet.
+    """
+    statement = select(
+        FeedSubscription.id.label("subscription_id"),
+        FeedSubscription.feed_id,
+        FeedSubscription.unread_count,
+    ).where(
+        FeedSubscription.user_id == user.id,
+    ).order_by(FeedSubscription.id)
+    results = db_session.exec(statement)
+    subscriptions = [
+        UnreadCountOut.model_validate(row) for row in results.all()
+    ]
+
+    return UnreadCountsOut(
+        total=sum(
+            subscription.unread_count for subscription in subscriptions
+        ),
+        subscriptions=subscriptions,
+    )
+
+
+def get_feeds_version(
+    db_session: Session = Depends(get_db_session),
+) -> tuple:
+    """
+    Changes whenever a feed is added. Feeds are not edited or deleted
+    through the API, their rows are only updated by polling, with
+    columns FeedOut does not show.
+    """
+    statement = select(func.count(), func.coalesce(func.max(Feed.id), 0))
+    return tuple(db_session.exec(statement).one())
+
+
+def get_subscriptions_version(
+    user: Principal,
+    db_session: Session = Depends(get_db_session),
+) -> tuple:
+    """
+    Changes whenever the user subscribes or unsubscribes. Subscription
+    ids only grow, so the set can not change back to the same count and
+    newest id.
+    """
+    statement = select(
+        func.count(),
+        func.coalesce(func.max(FeedSubscription.id), 0),
+    ).where(FeedSubscription.user_id == user.id)
+    return tuple(db_session.exec(statement).one())
+
+
+def get_user_feed_entries_version(
+    user: Principal,
+    db_session: Session = Depends(get_db_session),
+) -> tuple:
+    """
+    Changes whenever the user's entries or their read state change, read
+    from the user's subscription rows without touching any entry. With
+    settings.lazy_read_state new entries are listed before they are
+    fanned out, the version changes once they are.
+    """
+    statement = select(
+        func.count(),
+        func.coalesce(func.max(FeedSubscription.id), 0),
+        func.coalesce(func.sum(FeedSubscription.entries_version), 0),
+    ).where(FeedSubscription.user_id == user.id)
+    return (get_read_state_mode(), *db_session.exec(statement).one())
+
+
+def get_read_state_mode() -> str:
+    # entry ids differ between the modes, cached values must not be shared
+    return "lazy" if settings.lazy_read_state else "materialized"
+
+
+def get_user_feed_entry_out(
+    user: Principal,
+    user_feed_id: int,
+    db_session: Session = Depends(get_db_session),
+) -> UserFeedEntryOut:
+    """
+    user_feed_id is a FeedEntry.id when settings.lazy_read_state is enabled
+    and a UserFeedEntry.id otherwise.
+    """
+    id_column, _, _ = get_user_feed_entry_key_columns()
+    statement = select_user_feed_entries(user.id).where(
+        id_column == user_feed_id,
+    )
+    results = db_session.exec(statement)
+    row = results.first()
+
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Feed entry not found.",
+        )
+
+    return UserFeedEntryOut.model_validate(row)
+
+
+def lock_subscriptions(db_session: Session, *filters) -> list[int]:
+    """
+    Locks the matching subscriptions until the transaction ends, so read
+    state changes and fan-outs take turns updating their unread counts,
+    and bumps their entries_version. Rows are locked in id order to avoid
+    deadlocks. Returns the user ids of the subscriptions.
+    """
+    locked_ids = select(FeedSubscription.id).where(*filters).order_by(
+        FeedSubscription.id,
+    ).with_for_update()
+    statement = update(FeedSubscription).where(
+        FeedSubscription.id.in_(locked_ids.scalar_subquery()),
+    ).values(
+        entries_version=FeedSubscription.entries_version + 1,
+    ).returning(FeedSubscription.user_id)
+    return db_session.execute(statement).scalars().all()
+
+
+def count_user_feed_entries(
+    statement,
+    db_session: Session = Depends(get_db_session),
+) -> tuple[int, dict[int, int]]:
+    """
+    Counts the entries a select_user_feed_entries statement matches.
+    Returns the total and, per subscription, how many of them
+    FeedSubscription.unread_count covers, the ones up to its high-water
+    mark.
+    """
+    statement = statement.with_only_columns(
+        FeedSubscription.id,
+        func.count(),
+        func.count().filter(FeedEntry.id <= FeedSubscription.last_entry_id),
+    ).group_by(FeedSubscription.id)
+    rows = db_session.exec(statement).all()
+
+    return (
+        sum(count for _, count, _ in rows),
+        {subscription_id: covered for subscription_id, _, covered in rows},
+    )
+
+
+def change_unread_counts(
+    changes: dict[int, int],
+    db_session: Session = Depends(get_db_session),
+):
+    """
+    Adds the changes, keyed by subscription id, to the unread counts with
+    one UPDATE. Does not commit.
+    """
+    changes = {
+        subscription_id: change
+        for subscription_id, change in changes.items()
+        if change
+    }
+    if not changes:
+        return
+
+    unread_count_changes = values(
+        column("subscription_id", Integer),
+        column("change", Integer),
+        name="unread_count_changes",
+    ).data(sorted(changes.items()))
+    statement = update(FeedSubscription).where(
+        FeedSubscription.id == unread_count_changes.c.subscription_id,
+    ).values(
+        unread_count=(
+            FeedSubscription.unread_count + unread_count_changes.c.change
+        ),
+    )
+    db_session.execute(statement)
+
+
+def set_user_feed_entry_read_state(
+    user: Principal,
+    user_feed_id: int,
+    is_read: bool,
+    db_session: Session = Depends(get_db_session),
+) -> UserFeedEntryOut:
+    """
+    Changes the read state with a single statement that only matches
+    entries of the user's own subscriptions, and the unread count of the
+    subscription if the state changed. Commits, the caller invalidates
+    the user's caches afterwards.
+    """
+    id_column, is_read_column, _ = get_user_feed_entry_key_columns()
+    user_entries = select_user_feed_entries(user.id).where(
+        id_column == user_feed_id,
+    )
+    lock_subscriptions(
+        db_session,
+        FeedSubscription.id.in_(
+            user_entries.with_only_columns(FeedSubscription.id),
+        ),
+    )
+    _, changed_counts = count_user_feed_entries(
+        user_entries.where(is_read_column != is_read),
+        db_session,
+    )
+
+    if settings.lazy_read_state:
+        # records the exception, whatever state the cursor implies
+        user_entry = select(
+            FeedSubscription.id,
+            FeedEntry.id,
+            literal(is_read),
+            false(),
+            false(),
+        ).join(
+            FeedEntry,
+            FeedEntry.feed_id == FeedSubscription.feed_id,
+        ).where(
+            FeedEntry.id == user_feed_id,
+            FeedSubscription.user_id == user.id,
+        )
+        statement = insert(UserFeedEntry).from_select(
+            [
+                "subscription_id",
+                "feed_entry_id",
+                "is_read",
+                "is_favorite",
+                "is_archived",
+            ],
+            user_entry,
+        ).on_conflict_do_update(
+            index_elements=["subscription_id", "feed_entry_id"],
+            set_={"is_read": is_read, "updated_at": func.now()},
+        )
+    else:
+        user_subscription_ids = select(FeedSubscription.id).where(
+            FeedSubscription.user_id == user.id,
+        )
+        statement = update(UserFeedEntry).where(
+            UserFeedEntry.id == user_feed_id,
+            UserFeedEntry.subscription_id.in_(user_subscription_ids),
+        ).values(is_read=is_read)
+
+    if not db_session.execute(statement).rowcount:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Feed entry not found.",
+        )
+    change_unread_counts(
+        {
+            subscription_id: -count if is_read else count
+            for subscription_id, count in changed_counts.items()
+        },
+        db_session,
+    )
+    db_session.commit()
+
+    return get_user_feed_entry_out(user, user_feed_id, db_session)
+
+
+def mark_user_feed_entries_read(
+    user: Principal,
+    db_session: Session = Depends(get_db_session),
+    entry_ids: list[int] | None = None,
+    subscription_id: int | None = None,
+    up_to_id: int | None = None,
+) -> int:
+    """
+    Marks the user's unread entries read in bulk, optionally limited to
+    the given ids, one subscription and/or the entries up to up_to_id.
+    Ids are those returned by /me/feed-entries for the storage mode.
+    The unread counts of the subscriptions go down in the same
+    transaction. Commits, the caller invalidates the user's caches
+    afterwards. Returns the number of entries that changed.
+    """
+    subscription_filters = [FeedSubscription.user_id == user.id]
+    if subscription_id is not None:
+        subscription_filters.append(FeedSubscription.id == subscription_id)
+
+    id_column, is_read_column, _ = get_user_feed_entry_key_columns()
+    entry_filters = [is_read_column == False]  # noqa
+    if entry_ids is not None:
+        entry_filters.append(id_column.in_(entry_ids))
+    if up_to_id is not None:
+        entry_filters.append(id_column <= up_to_id)
+
+    lock_subscriptions(db_session, *subscription_filters)
+    marked_count, covered_counts = count_user_feed_entries(
+        select_user_feed_entries(user.id).where(
+            *subscription_filters,
+            *entry_filters,
+        ),
+        db_session,
+    )
+    change_unread_counts(
+        {
+            subscription_id: -count
+            for subscription_id, count in covered_counts.items()
+        },
+        db_session,
+    )
+
+    if not settings.lazy_read_state:
+        statement = update(UserFeedEntry).where(
+            UserFeedEntry.subscription_id.in_(
+                select(FeedSubscription.id).where(*subscription_filters)
+            ),
+            *entry_filters,
+        ).values(is_read=True)
+        db_session.execute(statement)
+        db_session.commit()
+        return marked_count
+
+    if entry_ids is not None:
+        # individual entries are recorded as exceptions to the cursor
+        user_entries = select(
+            FeedSubscription.id,
+            FeedEntry.id,
+            true(),
+            false(),
+            false(),
+        ).join(
+            FeedEntry,
+            FeedEntry.feed_id == FeedSubscription.feed_id,
+        ).outerjoin(
+            UserFeedEntry,
+            and_(
+                UserFeedEntry.subscription_id == FeedSubscription.id,
+                UserFeedEntry.feed_entry_id == FeedEntry.id,
+            ),
+        ).where(*subscription_filters, *entry_filters)
+        statement = insert(UserFeedEntry).from_select(
+            [
+                "subscription_id",
+                "feed_entry_id",
+                "is_read",
+                "is_favorite",
+                "is_archived",
+            ],
+            user_entries,
+        ).on_conflict_do_update(
+            index_elements=["subscription_id", "feed_entry_id"],
+            set_={"is_read": True, "updated_at": func.now()},
+        )
+        db_session.execute(statement)
+        db_session.commit()
+        return marked_count
+
+    # everything up to a point: the cursors move forward instead
+    newest_entry_id = select(func.max(FeedEntry.id)).where(
+        FeedEntry.feed_id == FeedSubscription.feed_id,
+    ).scalar_subquery()
+    new_cursor = func.coalesce(newest_entry_id, 0)
+    if up_to_id is not None:
+        new_cursor = func.least(new_cursor, up_to_id)
+
+    statement = update(FeedSubscription).where(
+        *subscription_filters,
+    ).values(
+        read_cursor_entry_id=func.greatest(
+            FeedSubscription.read_cursor_entry_id,
+            new_cursor,
+        ),
+    )
+    db_session.execute(statement)
+
+    # exceptions below the new cursors no longer say anything, the ones
+    # of favorite or archived entries are kept, as read entries
+    exception_filters = [
+        UserFeedEntry.subscription_id == FeedSubscription.id,
+        UserFeedEntry.feed_entry_id <= FeedSubscription.read_cursor_entry_id,
+    ]
+    if up_to_id is not None:
+        # a cursor that already was further keeps its unread exceptions
+        exception_filters.append(UserFeedEntry.feed_entry_id <= up_to_id)
+
+    statement = delete(UserFeedEntry).where(
+        *subscription_filters,
+        *exception_filters,
+        UserFeedEntry.is_favorite == False,  # noqa
+        UserFeedEntry.is_archived == False,  # noqa
+    )
+    db_session.execute(statement)
+    statement = update(UserFeedEntry).where(
+        *subscription_filters,
+        *exception_filters,
+        UserFeedEntry.is_read == False,  # noqa
+    ).values(is_read=True)
+    db_session.execute(statement)
+    db_session.commit()
+
+    return marked_count
+
+
+def migrate_to_lazy_read_state(
+    db_session: Session = Depends(get_db_session),
+    batch_size: int = 1000,
+) -> int:
+    """
+    Converts materialized UserFeedEntry rows to read cursors, run it once
+    before enabling settings.lazy_read_state.
+
+    Each subscription's cursor is set right below its oldest unread entry
+    (or to its high-water mark when everything is read), then the rows
+    whose state the cursor already implies are deleted. Rows of favorite,
+    archived or out of order read/unread entries are kept as exceptions.
+    Works through the subscriptions in batches, committing after each.
+    Returns the number of deleted rows.
+    """
+    deleted_count = 0
+    last_subscription_id = 0
+
+    while True:
+        statement = select(FeedSubscription.id).where(
+            FeedSubscription.id > last_subscription_id,
+        ).order_by(FeedSubscription.id).limit(batch_size)
+        results = db_session.exec(statement)
+        subscription_ids = results.all()
+
+        if not subscription_ids:
+            return deleted_count
+
+        oldest_unread_entry_id = select(
+            func.min(UserFeedEntry.feed_entry_id),
+        ).where(
+            UserFeedEntry.subscription_id == FeedSubscription.id,
+            UserFeedEntry.is_read == False,  # noqa
+        ).scalar_subquery()
+
+        statement = update(FeedSubscription).where(
+            FeedSubscription.id.in_(subscription_ids),
+        ).values(
+            read_cursor_entry_id=func.coalesce(
+                oldest_unread_entry_id - 1,
+                FeedSubscription.last_entry_id,
+            ),
+        )
+        db_session.execute(statement)
+
+        statement = delete(UserFeedEntry).where(
+            UserFeedEntry.subscription_id == FeedSubscription.id,
+            FeedSubscription.id.in_(subscription_ids),
+            UserFeedEntry.is_favorite == False,  # noqa
+            UserFeedEntry.is_archived == False,  # noqa
+            UserFeedEntry.is_read == (
+                UserFeedEntry.feed_entry_id
+                <= FeedSubscription.read_cursor_entry_id
+            ),
+        )
+        deleted_count += db_session.execute(statement).rowcount
+        db_session.commit()
+
+        last_subscription_id = subscription_ids[-1]
+
+
+# FeedEntry columns kept in FeedEntryArchive
+ARCHIVED_ENTRY_COLUMNS = (
+    FeedEntry.id,
+    FeedEntry.feed_id,
+    FeedEntry.guid,
+    FeedEntry.publish_date,
+    FeedEntry.created_at,
+    FeedEntry.title,
+    FeedEntry.link,
+    FeedEntry.description,
+    FeedEntry.summary,
+    FeedEntry.author,
+)
+
+
+def prune_expired_feed_entries(
+    db_session: Session = Depends(get_db_session),
+    batch_size: int = 1000,
+) -> tuple[int, int]:
+    """
+    Removes the entries each feed's retention policy expires, along with
+    their UserFeedEntry rows, see prune_feed_entries. Feeds without a
+    policy of their own use the global one of settings.
+    Returns the numbers of removed FeedEntry and UserFeedEntry rows.
+    """
+    removed_entry_count = removed_user_entry_count = 0
+    last_feed_id = 0
+
+    while True:
+        statement = select(
+            Feed.id,
+            Feed.retention_max_age_days,
+            Feed.retention_max_items,
+        ).where(Feed.id > last_feed_id).order_by(Feed.id).limit(batch_size)
+        feeds = db_session.exec(statement).all()
+
+        if not feeds:
+            return removed_entry_count, removed_user_entry_count
+
+        for feed_id, max_age_days, max_items in feeds:
+            entry_count, user_entry_count = prune_feed_entries(
+                feed_id,
+                (
+                    settings.entry_retention_max_age_days
+                    if max_age_days is None
+                    else max_age_days
+                ),
+                (
+                    settings.entry_retention_max_items_per_feed
+                    if max_items is None
+                    else max_items
+                ),
+                db_session,
+                batch_size,
+            )
+            removed_entry_count += entry_count
+            removed_user_entry_count += user_entry_count
+
+        last_feed_id = feeds[-1].id
+
+
+def prune_feed_entries(
+    feed_id: int,
+    max_age_days: int,
+    max_items: int,
+    db_session: Session = Depends(get_db_session),
+    batch_size: int = 1000,
+) -> tuple[int, int]:
+    """
+    Removes the feed's entries older than max_age_days or beyond its
+    newest max_items, 0 turns either limit off. The unread counts of the
+    subscriptions lose the removed unread entries. Removes batch_size
+    entries per transaction, so subscriptions of the feed are only locked
+    briefly. Returns the numbers of removed FeedEntry and UserFeedEntry
+    rows.
+    """
+    removed_entry_count = removed_user_entry_count = 0
+
+    while True:
+        expired_entries = select_expired_feed_entries(
+            feed_id, max_age_days, max_items, db_session,
         )
-        results = db_session.exec(user_feed_entry_statement)
-        user_feed_entry = results.first()
+        if expired_entries is None:
+            return removed_entry_count, removed_user_entry_count
+
+        statement = expired_entries.order_by(FeedEntry.id).limit(batch_size)
+        entry_ids = db_session.exec(statement).all()
+
+        if not entry_ids:
+            return removed_entry_count, removed_user_entry_count
 
-        if user_feed_entry:
-            continue
+        user_ids = lock_subscriptions(
+            db_session,
+            FeedSubscription.feed_id == feed_id,
+        )
+        _, is_read_column, _ = get_user_feed_entry_key_columns()
+        _, covered_counts = count_user_feed_entries(
+            select_subscription_feed_entries().where(
+                FeedSubscription.feed_id == feed_id,
+                FeedEntry.id.in_(entry_ids),
+                is_read_column == False,  # noqa
+            ),
+            db_session,
+        )
+        change_unread_counts(
+            {
+                subscription_id: -covered_count
+                for subscription_id, covered_count in covered_counts.items()
+            },
+            db_session,
+        )
 
-        user_feed_entry = UserFeedEntry(
-            subscription_id=subscription.id,
-            feed_entry_id=entry.id,
-            is_read=False,
+        statement = delete(UserFeedEntry).where(
+            UserFeedEntry.feed_entry_id.in_(entry_ids),
         )
-        db_session.add(user_feed_entry)
+        removed_user_entry_count += db_session.execute(statement).rowcount
+
+        statement = delete(FeedEntry).where(
+            FeedEntry.id.in_(entry_ids),
+        ).returning(*ARCHIVED_ENTRY_COLUMNS)
+        removed_entries = db_session.execute(statement).all()
+        removed_entry_count += len(removed_entries)
+
+        if settings.entry_retention_archive:
+            statement = insert(FeedEntryArchive).values([
+                get_archived_entry_values(entry) for entry in removed_entries
+            ]).on_conflict_do_nothing(index_elements=["id"])
+            db_session.execute(statement)
+
         db_session.commit()
+        invalidate_user_caches(user_ids)
+
+        if len(entry_ids) < batch_size:
+            return removed_entry_count, removed_user_entry_count
+
+
+def select_expired_feed_entries(
+    feed_id: int,
+    max_age_days: int,
+    max_items: int,
+    db_session: Session = Depends(get_db_session),
+):
+    """
+    Selects the ids of the feed's entries the policy expires, or returns
+    None when it expires none. Entries the feed's last parsed document
+    lists never expire, see mark_feed_entries_seen. Neither do the newest
+    settings.entry_retention_min_items_per_feed entries, at least as many
+    as a poll stores, nor favorite or archived ones with
+    settings.entry_retention_keep_favorites.
+    """
+    min_items = max(
+        settings.entry_retention_min_items_per_feed,
+        settings.feed_parse_max_entries,
+    )
+    entry_key = tuple_(FeedEntry.created_at, FeedEntry.id)
+    policy_filters = []
+
+    if max_items:
+        oldest_kept_key = get_oldest_kept_entry_key(
+            feed_id, max(max_items, min_items), db_session,
+        )
+        if oldest_kept_key:
+            policy_filters.append(entry_key < tuple_(*oldest_kept_key))
+    if max_age_days:
+        policy_filters.append(
+            FeedEntry.created_at < utc_now() - timedelta(days=max_age_days),
+        )
+
+    if not policy_filters:
+        return None
+
+    statement = select(func.max(FeedEntry.last_seen_at)).where(
+        FeedEntry.feed_id == feed_id,
+    )
+    last_seen_at = db_session.exec(statement).one()
+    # the feed was not parsed since entries are stamped, any of them may
+    # still be listed
+    if last_seen_at is None:
+        return None
+
+    filters = [
+        FeedEntry.feed_id == feed_id,
+        or_(*policy_filters),
+        or_(
+            FeedEntry.last_seen_at == None,  # noqa
+            FeedEntry.last_seen_at < literal(last_seen_at),
+        ),
+    ]
+
+    if min_items:
+        oldest_kept_key = get_oldest_kept_entry_key(
+            feed_id, min_items, db_session,
+        )
+        if not oldest_kept_key:
+            return None
+        filters.append(entry_key < tuple_(*oldest_kept_key))
+
+    if settings.entry_retention_keep_favorites:
+        filters.append(~exists().where(
+            UserFeedEntry.feed_entry_id == FeedEntry.id,
+            or_(
+                UserFeedEntry.is_favorite == True,  # noqa
+                UserFeedEntry.is_archived == True,  # noqa
+            ),
+        ))
+
+    return select(FeedEntry.id).where(*filters)
+
+
+def get_oldest_kept_entry_key(
+    feed_id: int,
+    kept_count: int,
+    db_session: Session = Depends(get_db_session),
+) -> tuple | None:
+    """
+    Returns the (created_at, id) literals of the feed's kept_count-th
+    newest entry, None when the feed has fewer entries.
+    """
+    statement = select(FeedEntry.created_at, FeedEntry.id).where(
+        FeedEntry.feed_id == feed_id,
+    ).order_by(
+        FeedEntry.created_at.desc(),
+        FeedEntry.id.desc(),
+    ).offset(kept_count - 1).limit(1)
+    row = db_session.exec(statement).first()
+
+    if row is None:
+        return None
+    return literal(row.created_at), literal(row.id)
+
+
+def get_archived_entry_values(entry) -> dict:
+    return {
+        "id": entry.id,
+        "feed_id": entry.feed_id,
+        "guid": entry.guid,
+        "publish_date": entry.publish_date,
+        "created_at": entry.created_at,
+        "content": compress_archived_entry(entry),
+    }
+
+
+def compress_archived_entry(entry) -> bytes:
+    content = {
+        "title": entry.title,
+        "link": entry.link,
+        "description": entry.description,
+        "summary": entry.summary,
+        "author": entry.author,
+    }
+    return zlib.compress(json.dumps(content).encode())
+
+
+def decompress_archived_entry(content: bytes) -> dict:
+    return json.loads(zlib.decompress(content))
@@ -1,6 +1,9 @@
 from typing import Optional, List
 from datetime import datetime
-from sqlalchemy import Column, DateTime, func
+from uuid import uuid4
+from sqlalchemy import DDL, Column, DateTime, Engine, Index, event, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 import validators
 from pydantic import field_validator
@@ -12,13 +15,67 @@ from sqlmodel import (
     create_engine,
     UniqueConstraint,
 )
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from settings import settings
 
-engine = create_engine(
-    f"postgresql://{settings.postgres_user}:{settings.postgres_password}@"
-    f"{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}"
-)
+
+def get_database_url(driver: str = "postgresql") -> str:
+    return (
+        f"{driver}://{settings.postgres_user}:{settings.postgres_password}@"
+        f"{settings.postgres_host}:{settings.postgres_port}/"
+        f"{settings.postgres_db}"
+    )
+
+
+def get_pool_options() -> dict:
+    return {
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def create_db_engine() -> Engine:
+    return create_engine(
+        get_database_url(),
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        **get_pool_options(),
+    )
+
+
+def create_async_db_engine() -> AsyncEngine:
+    statement_cache_size = settings.async_db_statement_cache_size
+    connect_args = {}
+
+    # PgBouncer in transaction pooling mode runs every transaction on any
+    # of its server connections, prepared statements do not outlive it
+    if settings.db_pgbouncer_transaction_pooling:
+        statement_cache_size = 0
+        # unnamed statements can clash on a shared server connection too
+        connect_args["prepared_statement_name_func"] = (
+            lambda: f"__asyncpg_{uuid4()}__"
+        )
+
+    return create_async_engine(
+        f"{get_database_url('postgresql+asyncpg')}"
+        f"?prepared_statement_cache_size={statement_cache_size}",
+        pool_size=settings.async_db_pool_size,
+        max_overflow=settings.async_db_max_overflow,
+        connect_args={
+            "statement_cache_size": statement_cache_size,
+            **connect_args,
+        },
+        **get_pool_options(),
+    )
+
+
+# forked Celery workers replace the inherited pool, see
+# app.tasks.init_worker_process
+engine = create_db_engine()
+
+# used by the async endpoints, see get_async_db_session
+async_engine = create_async_db_engine()
 
 
 def get_db_session():
@@ -26,6 +83,21 @@ def get_db_session():
         yield session
 
 
+async def get_async_db_session():
+    """
+    Session of the async endpoints. They run the sync helpers of
+    app.model_helpers through AsyncSession.run_sync, which awaits every
+    query on asyncpg instead of holding a thread of the thread pool.
+
+    usage:
+        entry = await db_session.run_sync(
+            lambda session: get_user_feed_entry_out(user, id, session)
+        )
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 def create_db_and_tables(engine=engine):
     SQLModel.metadata.create_all(engine)
 
@@ -46,7 +118,11 @@ class User(SQLModel, table=True):
 
 
 class Feed(SQLModel, table=True):
-    __table_args__ = (UniqueConstraint("feed_url"),)
+    __table_args__ = (
+        UniqueConstraint("feed_url"),
+        # app.tasks.dispatch_due_feeds
+        Index("ix_feed_is_active_next_poll_at", "is_active", "next_poll_at"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     feed_entries: List["FeedEntry"] = Relationship(
         back_populates="feed",
@@ -56,7 +132,25 @@ class Feed(SQLModel, table=True):
     )
 
     feed_description: Optional[str] = None
+    # HTTP validators of the last fetched document, see app.fetcher
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    # adaptive polling schedule, see app.scheduling
+    poll_interval_seconds: Optional[int] = None
+    next_poll_at: Optional[datetime] = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            server_default=func.now(),
+            nullable=False,
+        )
+    )
     is_active: bool = True
+    # retention policy of the feed's entries, None falls back to
+    # settings.entry_retention_max_age_days and _max_items_per_feed, 0
+    # keeps entries of any age or number
+    retention_max_age_days: Optional[int] = None
+    retention_max_items: Optional[int] = None
     feed_url: str
     feed_title: str
 
@@ -68,7 +162,29 @@ class Feed(SQLModel, table=True):
         return value
 
 
+# text search configuration of FeedEntry.search_vector, queries have to
+# use the same one
+SEARCH_CONFIG = "english"
+
+
 class FeedEntry(SQLModel, table=True):
+    __table_args__ = (
+        # full-text search of app.model_helpers.search_user_feed_entries
+        Index(
+            "ix_feedentry_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+        ),
+        # guids are only unique within a feed, also serves ingestion lookups
+        UniqueConstraint("feed_id", "guid"),
+        # keyset pagination of entries with settings.lazy_read_state
+        Index(
+            "ix_feedentry_feed_id_created_at_id",
+            "feed_id",
+            "created_at",
+            "id",
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
     feed: Feed = Relationship(back_populates="feed_entries")
@@ -78,16 +194,99 @@ class FeedEntry(SQLModel, table=True):
     summary: Optional[str] = None
     author: Optional[str] = None
     publish_date: Optional[datetime] = None
+    created_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    # time of the latest parsed document of the feed that listed the
+    # entry, retention keeps the entries the feed still lists, see
+    # app.model_helpers.mark_feed_entries_seen
+    last_seen_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    # written by the feedentry_search_vector trigger, so every ingestion
+    # path keeps it up to date, see SEARCH_VECTOR_TRIGGER
+    search_vector: Optional[str] = Field(
+        default=None,
+        sa_column=Column(TSVECTOR),
+    )
     title: str
     link: str
     guid: str
 
 
+# parsers often copy the summary into the description, it is only
+# indexed when it differs
+SEARCH_VECTOR_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+    "coalesce({row}title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+    "coalesce({row}summary, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+    "coalesce(nullif({row}description, {row}summary), '')), 'C')"
+)
+
+# also created by the migration that added FeedEntry.search_vector
+SEARCH_VECTOR_TRIGGER = DDL(
+    "CREATE OR REPLACE FUNCTION feedentry_search_vector() "
+    "RETURNS trigger AS $$ BEGIN "
+    f"NEW.search_vector := {SEARCH_VECTOR_EXPRESSION.format(row='NEW.')}; "
+    "RETURN NEW; "
+    "END $$ LANGUAGE plpgsql; "
+    "CREATE TRIGGER feedentry_search_vector "
+    "BEFORE INSERT OR UPDATE OF title, summary, description ON feedentry "
+    "FOR EACH ROW EXECUTE FUNCTION feedentry_search_vector()"
+)
+event.listen(FeedEntry.__table__, "after_create", SEARCH_VECTOR_TRIGGER)
+
+
+class FeedEntryArchive(SQLModel, table=True):
+    """
+    Entries removed by app.model_helpers.prune_expired_feed_entries when
+    settings.entry_retention_archive is enabled
+    """
+    # the FeedEntry.id of the entry
+    id: Optional[int] = Field(
+        default=None,
+        primary_key=True,
+        sa_column_kwargs={"autoincrement": False},
+    )
+
+    feed_id: int = Field(default=None, foreign_key="feed.id", index=True)
+    guid: str
+    publish_date: Optional[datetime] = None
+    created_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True))
+    )
+    archived_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+    # zlib compressed JSON of the title, link, description, summary and
+    # author, see app.model_helpers.compress_archived_entry
+    content: bytes
+
+
+class FeedChangeEvent(SQLModel, table=True):
+    """
+    Outbox of feeds that gained entries, written in the same transaction
+    as the entries. Consumed by app.model_helpers.fan_out_feed_changes
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    feed_id: int = Field(default=None, foreign_key="feed.id", index=True)
+    # newest FeedEntry.id stored by the ingestion that emitted the event
+    max_entry_id: int
+
+    created_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now())
+    )
+
+
 class FeedSubscription(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
 
     user: User = Relationship(back_populates="subscribed_feeds")
-    user_id: int = Field(default=None, foreign_key="user.id")
+    # also serves the version lookups of app.model_helpers
+    user_id: int = Field(default=None, foreign_key="user.id", index=True)
 
     feed: "Feed" = Relationship(back_populates="feed_subscriptions")
     feed_id: int = Field(default=None, foreign_key="feed.id")
@@ -96,6 +295,26 @@ class FeedSubscription(SQLModel, table=True):
         back_populates="subscription",
     )
 
+    # high-water mark, the newest FeedEntry.id copied into user_feed_entries
+    last_entry_id: int = Field(default=0, sa_column_kwargs={
+        "server_default": "0",
+    })
+    # used when settings.lazy_read_state is enabled: entries up to this id
+    # are read unless a UserFeedEntry row says otherwise
+    read_cursor_entry_id: int = Field(default=0, sa_column_kwargs={
+        "server_default": "0",
+    })
+    # unread entries up to last_entry_id, kept up to date by the fan-out
+    # and by read state changes in the same transaction
+    unread_count: int = Field(default=0, sa_column_kwargs={
+        "server_default": "0",
+    })
+    # bumped by every change to the entries or read state of the
+    # subscription, ETags of the user's entries are derived from it
+    entries_version: int = Field(default=0, sa_column_kwargs={
+        "server_default": "0",
+    })
+
     # see:
     # https://github.com/tiangolo/sqlmodel/issues/370#issuecomment-1169674418
     created_at: Optional[datetime] = Field(
@@ -107,6 +326,17 @@ class FeedSubscription(SQLModel, table=True):
 
 
 class UserFeedEntry(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "feed_entry_id"),
+        # keyset pagination of /me/feed-entries filtered by is_read
+        Index(
+            "ix_userfeedentry_subscription_id_is_read_created_at_id",
+            "subscription_id",
+            "is_read",
+            "created_at",
+            "id",
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
     subscription: FeedSubscription = Relationship(
@@ -118,7 +348,12 @@ class UserFeedEntry(SQLModel, table=True):
     )
 
     feed_entry: FeedEntry = Relationship(back_populates=None)
-    feed_entry_id: int = Field(default=None, foreign_key="feedentry.id")
+    # also serves the foreign key checks of removing entries
+    feed_entry_id: int = Field(
+        default=None,
+        foreign_key="feedentry.id",
+        index=True,
+    )
 
     created_at: Optional[datetime] = Field(
         sa_column=Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,13 @@
+import redis
+
+from settings import settings
+
+
+# connects lazily, on the first command
+redis_client = redis.Redis.from_url(
+    settings.redis_host,
+    # callers fall back to the database when Redis is unavailable,
+    # which should not take longer than the query itself
+    socket_connect_timeout=settings.redis_socket_timeout_seconds,
+    socket_timeout=settings.redis_socket_timeout_seconds,
+)
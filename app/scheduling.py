@@ -0,0 +1,153 @@
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from statistics import median
+from typing import Optional
+
+from settings import settings
+
+
+SY_UPDATE_PERIOD_SECONDS = {
+    "hourly": 60 * 60,
+    "daily": 24 * 60 * 60,
+    "weekly": 7 * 24 * 60 * 60,
+    "monthly": 30 * 24 * 60 * 60,
+    "yearly": 365 * 24 * 60 * 60,
+}
+
+MAX_AGE_PATTERN = re.compile(r"(?:^|[,\s])max-age=(\d+)")
+
+
+def clamp_poll_interval(seconds: float) -> int:
+    return int(min(
+        max(seconds, settings.feed_poll_min_interval_seconds),
+        settings.feed_poll_max_interval_seconds,
+    ))
+
+
+def get_publish_cadence(publish_dates: list[datetime]) -> Optional[float]:
+    """Median number of seconds between consecutive publish dates"""
+    publish_dates = sorted(
+        publish_date for publish_date in publish_dates if publish_date
+    )
+    gaps = [
+        (newer - older).total_seconds()
+        for older, newer in zip(publish_dates, publish_dates[1:])
+    ]
+    gaps = [gap for gap in gaps if gap > 0]
+
+    if not gaps:
+        return None
+    return median(gaps)
+
+
+def get_max_age(cache_control: Optional[str]) -> Optional[int]:
+    if not cache_control or "no-cache" in cache_control:
+        return None
+
+    match = MAX_AGE_PATTERN.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+def get_retry_after(
+    retry_after: Optional[str],
+    now: datetime,
+) -> Optional[int]:
+    """Retry-After is either a number of seconds or an HTTP date"""
+    if not retry_after:
+        return None
+
+    if retry_after.strip().isdigit():
+        return int(retry_after)
+
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    # dates in -0000 parse naive, they are in UTC all the same
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(int((retry_at - now).total_seconds()), 0)
+
+
+def get_feed_update_hint(feed_info: dict) -> Optional[int]:
+    """
+    Longest update period the feed document asks for, from RSS <ttl>
+    (minutes) and the syndication module's updatePeriod/updateFrequency.
+    """
+    hints = []
+
+    ttl = str(feed_info.get("ttl", "")).strip()
+    if ttl.isdigit():
+        hints.append(int(ttl) * 60)
+
+    update_period = SY_UPDATE_PERIOD_SECONDS.get(
+        str(feed_info.get("sy_updateperiod", "")).strip().lower()
+    )
+    if update_period:
+        update_frequency = str(feed_info.get("sy_updatefrequency", "1"))
+        update_frequency = update_frequency.strip()
+        update_frequency = (
+            int(update_frequency) if update_frequency.isdigit() else 1
+        )
+        hints.append(update_period // max(update_frequency, 1))
+
+    return max(hints) if hints else None
+
+
+def compute_poll_interval(
+    publish_dates: list[datetime],
+    feed_info: dict,
+    headers: dict[str, str],
+) -> int:
+    """
+    Polls at half the observed publish cadence so new items are picked up
+    soon after they appear, but never more often than the feed itself
+    (ttl, sy:updatePeriod) or its HTTP caching headers ask for.
+    """
+    cadence = get_publish_cadence(publish_dates)
+    interval = (
+        cadence / 2
+        if cadence
+        else settings.feed_poll_default_interval_seconds
+    )
+
+    lower_bounds = [
+        get_feed_update_hint(feed_info),
+        get_max_age(headers.get("cache-control")),
+    ]
+    interval = max(
+        [interval] + [bound for bound in lower_bounds if bound is not None]
+    )
+
+    return clamp_poll_interval(interval)
+
+
+def compute_unchanged_poll_interval(
+    previous_interval: Optional[int],
+    headers: dict[str, str],
+) -> int:
+    """Interval after a 304 or an unchanged document"""
+    interval = previous_interval or settings.feed_poll_default_interval_seconds
+    max_age = get_max_age(headers.get("cache-control"))
+
+    return clamp_poll_interval(max(interval, max_age or 0))
+
+
+def compute_retry_poll_at(
+    now: datetime,
+    headers: Optional[dict[str, str]] = None,
+) -> datetime:
+    """Next poll after a failed fetch, honoring Retry-After if given"""
+    retry_after = get_retry_after((headers or {}).get("retry-after"), now)
+
+    if retry_after is None:
+        retry_after = settings.feed_poll_error_interval_seconds
+
+    return now + timedelta(
+        seconds=min(retry_after, settings.feed_poll_max_interval_seconds)
+    )
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
@@ -43,3 +43,35 @@ class UserFeedEntryOut(BaseModel):
     feed_id: int
     title: str
     id: int
+
+
+class UserFeedEntryPage(BaseModel):
+    items: list[UserFeedEntryOut]
+    # opaque, pass it as cursor to get the next page
+    next_cursor: Optional[str] = None
+
+
+class UserFeedEntryIdsIn(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class MarkedCountOut(BaseModel):
+    count: int
+
+
+class RefreshJobOut(BaseModel):
+    job_id: str
+    # celery task state, e.g. PENDING, STARTED, SUCCESS or FAILURE
+    status: str
+
+
+class UnreadCountOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    subscription_id: int
+    feed_id: int
+    unread_count: int
+
+
+class UnreadCountsOut(BaseModel):
+    total: int
+    subscriptions: list[UnreadCountOut]
@@ -1,19 +1,44 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Annotated
+from typing import Annotated, Any, Callable, NamedTuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from sqlalchemy import event, inspect
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.models import User, get_db_session
+from app.models import User, get_async_db_session, get_db_session
+from app.utils import TTLCache
 from settings import settings
 
 
+def get_password_context(rounds: int) -> CryptContext:
+    # hashes of any other cost are reported as needing an update
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=rounds,
+    )
+
+
 # see for reference: https://fastapi.tiangolo.com/tutorial/security/oauth2-jwt/
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = get_password_context(settings.password_hash_rounds)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# bcrypt releases the GIL, every worker thread keeps a core busy
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash",
+)
+password_hash_slots = threading.BoundedSemaphore(
+    settings.password_hash_max_pending,
+)
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -23,26 +48,90 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def authenticate_user(
+async def run_password_hashing(function: Callable, *args) -> Any:
+    """
+    Runs a bcrypt call on the password hashing pool, so that hashing
+    holds neither the event loop nor a thread of the request thread pool.
+    Turns the request away with 503 when password_hash_max_pending calls
+    are already queued or running, instead of letting the queue grow.
+
+    usage:
+        hashed_password = await run_password_hashing(hash_password, password)
+    """
+    if not password_hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts, try again later.",
+            headers={"Retry-After": "1"},
+        )
+
+    try:
+        future = password_hash_executor.submit(function, *args)
+    except BaseException:
+        password_hash_slots.release()
+        raise
+    # released when the hash is done, even if the request went away
+    future.add_done_callback(lambda _: password_hash_slots.release())
+
+    return await asyncio.wrap_future(future)
+
+
+async def authenticate_user(
     db_session: Annotated[Session, Depends(get_db_session)],
     username: str,
     password: str,
 ) -> User | None:
+    """
+    Checks the password on the password hashing pool. Passwords hashed
+    with another cost than password_hash_rounds are rehashed with the
+    current one once they are verified.
+    """
     statement = select(User).where(User.username == username)
-    results = db_session.exec(statement)
+    results = await run_in_threadpool(db_session.exec, statement)
     user: User | None = results.first()
 
-    if user and verify_password(password, user.password):
-        return user
-    return
+    if not user:
+        return
+
+    is_valid, new_hash = await run_password_hashing(
+        pwd_context.verify_and_update,
+        password,
+        user.password,
+    )
+    if not is_valid:
+        return
+
+    if new_hash:
+        user.password = new_hash
+        db_session.add(user)
+        await run_in_threadpool(db_session.commit)
+    return user
+
 
+class Principal(NamedTuple):
+    """The authenticated user, as handlers see it"""
+    id: int
+    username: str
+    is_active: bool
 
-def create_access_token(username: str):
+
+principal_cache = TTLCache(
+    max_size=settings.principal_cache_max_size,
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+)
+
+
+def create_access_token(user: User):
     token_expires_delta = timedelta(
         minutes=settings.access_token_expire_minutes,
     )
     expire = datetime.now(timezone.utc) + token_expires_delta
-    to_encode = {"sub": username, "exp": expire}
+    to_encode = {
+        "sub": user.username,
+        "uid": user.id,
+        "active": user.is_active,
+        "exp": expire,
+    }
 
     encoded_jwt = jwt.encode(
         to_encode,
@@ -52,10 +141,55 @@ def create_access_token(username: str):
     return encoded_jwt
 
 
-def get_current_user(
+def get_principal(
+    user_id: int,
     db_session: Annotated[Session, Depends(get_db_session)],
+) -> Principal | None:
+    """
+    Returns the user from the principal cache, or loads it by primary key
+    and caches it. Returns None if the user does not exist.
+    """
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    statement = select(User.id, User.username, User.is_active).where(
+        User.id == user_id,
+    )
+    results = db_session.exec(statement)
+    row = results.first()
+
+    if row is None:
+        return None
+
+    principal = Principal(*row)
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+@event.listens_for(User, "after_update")
+def forget_changed_principal(mapper, connection, target: User):
+    """
+    Drops deactivated or renamed users from this process' principal
+    cache. Other processes pick up the change once their entry expires.
+    """
+    state = inspect(target)
+    if (
+        state.attrs.is_active.history.has_changes()
+        or state.attrs.username.history.has_changes()
+    ):
+        principal_cache.pop(target.id)
+
+
+async def get_current_user(
+    db_session: Annotated[AsyncSession, Depends(get_async_db_session)],
     token: Annotated[str, Depends(oauth2_scheme)],
-):
+) -> Principal:
+    """
+    Authenticates the request from the token claims. The database is only
+    read when the user is not in the principal cache, tokens of inactive
+    users are turned away without reading it at all.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,24 +202,29 @@ def get_current_user(
             algorithms=[settings.jwt_algorithm],
         )
         username: str = payload.get("sub")
-        if username is None:
+        user_id: int = payload.get("uid")
+        # tokens issued before the uid claim was added are not accepted
+        if username is None or not isinstance(user_id, int):
             raise credentials_exception
 
     except JWTError:
         raise credentials_exception
 
-    statement = select(User).where(User.username == username)
-    results = db_session.exec(statement)
-    user = results.first()
+    if not payload.get("active", False):
+        return Principal(id=user_id, username=username, is_active=False)
+
+    principal = await db_session.run_sync(
+        lambda session: get_principal(user_id, session),
+    )
 
-    if user is None:
+    if principal is None:
         raise credentials_exception
-    return user
+    return principal
 
 
-def get_current_active_user(
-    current_user: Annotated[User, Depends(get_current_user)],
-):
+async def get_current_active_user(
+    current_user: Annotated[Principal, Depends(get_current_user)],
+) -> Principal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
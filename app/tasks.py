@@ -1,11 +1,49 @@
-from celery import Celery, Task
+import asyncio
+import time
+from datetime import timedelta
+from itertools import batched
+from uuid import uuid4
+
+from celery import Celery, Task, group
+from celery.result import AsyncResult
 from celery.schedules import crontab
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
+from fastapi import HTTPException, status
+import httpx
+import redis
+from sqlalchemy import update
 from sqlmodel import Session, select
-from app.model_helpers import update_entries_for_feed
+from app.feed_parser import parse_feeds
+from app.fetcher import fetch_feeds
+from app.locks import (
+    acquire_feed_locks,
+    release_feed_locks,
+    single_flight,
+    wait_for_feed_updates,
+)
+from app.model_helpers import (
+    fan_out_feed_changes,
+    get_parse_job,
+    get_parse_options,
+    get_recent_guids,
+    migrate_to_lazy_read_state,
+    prune_expired_feed_entries,
+    schedule_retry_poll,
+    skip_unchanged_fetch_result,
+    store_parsed_feed,
+    update_entries_for_feed,
+    update_entries_for_subscriptions,
+    update_subscription_entries,
+)
 
 from settings import settings
 from app.models import Feed, FeedSubscription, User, engine
+from app.redis_client import redis_client
+from app.scheduling import utc_now
+
 
+logger = get_task_logger(__name__)
 
 celery_app = Celery(
     __name__,
@@ -16,17 +54,33 @@ celery_app = Celery(
 
 
 celery_app.conf.beat_schedule = {
-    'update_all_user_subscriptions_every_5_minutes': {
-        'task': 'app.tasks.update_all_user_subscriptions',
-        'schedule': crontab(minute='*/5'),
+    # picks up change events whose triggering message got lost
+    'fan_out_feed_changes_every_minute': {
+        'task': 'app.tasks.fan_out_feed_changes_task',
+        'schedule': crontab(minute='*'),
     },
-    'update_all_feeds_every_5_minutes': {
-        'task': 'app.tasks.update_all_feeds',
-        'schedule': crontab(minute='*/5'),
+    'dispatch_due_feeds_every_minute': {
+        'task': 'app.tasks.dispatch_due_feeds',
+        'schedule': crontab(minute='*'),
+    },
+    'prune_feed_entries_every_night': {
+        'task': 'app.tasks.prune_feed_entries_task',
+        'schedule': crontab(hour=3, minute=0),
     },
 }
 
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """
+    Prefork workers inherit the connections the parent opened before
+    forking, and two processes talking over one socket corrupt each
+    other's results. Every worker starts with a pool of its own, the
+    parent's connections are left open for the parent.
+    """
+    engine.dispose(close=False)
+
+
 class BaseTaskWithRetry(Task):
     autoretry_for = (Exception,)
     retry_backoff = True
@@ -42,12 +96,266 @@ def update_entries_for_feed_task(feed_id: int):
         results = session.exec(statement)
         feed = results.first()
 
-        if feed:
-            update_entries_for_feed(
+        if not feed:
+            return
+
+        with single_flight(feed.id) as is_owner:
+            if not is_owner:
+                return
+
+            new_entry_count = update_entries_for_feed(
                 feed=feed,
                 db_session=session,
-                mark_subscriptions_for_update=True,
             )
+            if new_entry_count:
+                fan_out_feed_changes_task.delay()
+
+
+def get_feed_refresh_key(feed_id: int) -> str:
+    return f"feed-refresh:{feed_id}"
+
+
+def mark_feeds_refreshed(feed_ids: list[int]):
+    """
+    Remembers for feed_refresh_min_interval_seconds that the feeds were
+    just fetched, user triggered refreshes skip them in the meantime.
+    """
+    try:
+        with redis_client.pipeline() as pipeline:
+            for feed_id in feed_ids:
+                pipeline.set(
+                    get_feed_refresh_key(feed_id),
+                    1,
+                    ex=settings.feed_refresh_min_interval_seconds,
+                )
+            pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not mark feeds %s as refreshed", feed_ids)
+
+
+def claim_feeds_for_refresh(feed_ids: list[int]) -> list[int]:
+    """
+    Returns the feeds that were neither fetched recently nor are being
+    fetched for another refresh, and claims them for the caller. Without
+    Redis every feed is claimed, feed locks still keep concurrent fetches
+    of a feed apart.
+    """
+    try:
+        with redis_client.pipeline() as pipeline:
+            for feed_id in feed_ids:
+                pipeline.set(
+                    get_feed_refresh_key(feed_id),
+                    1,
+                    nx=True,
+                    ex=settings.feed_refresh_min_interval_seconds,
+                )
+            claimed = pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not claim feeds %s, refreshing all", feed_ids)
+        return list(feed_ids)
+
+    return [
+        feed_id
+        for feed_id, is_claimed in zip(feed_ids, claimed)
+        if is_claimed
+    ]
+
+
+def get_error_response_headers(error: BaseException) -> dict[str, str]:
+    """Headers of a 4xx/5xx response, these may carry a Retry-After"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return {
+            key.lower(): value
+            for key, value in error.response.headers.items()
+        }
+    return {}
+
+
+def update_feeds(feed_ids: list[int], session: Session, wait: bool = False):
+    """
+    Fetches the feeds concurrently, then ingests them one by one and fans
+    out their new entries. A failing feed is logged and skipped so that it
+    does not affect the others.
+    Feeds that another worker is already updating are skipped as well,
+    with wait set this returns only after those updates are done.
+    """
+    token = uuid4().hex
+    locked_feed_ids = acquire_feed_locks(feed_ids, token)
+
+    try:
+        statement = select(Feed).where(Feed.id.in_(locked_feed_ids))
+        results = session.exec(statement)
+        feeds = results.all()
+
+        if feeds:
+            ingest_feeds(feeds, session)
+    finally:
+        release_feed_locks(locked_feed_ids, token)
+
+    # our own locks are released first, so that two waiting workers can
+    # never hold a feed the other one waits for
+    if wait:
+        wait_for_feed_updates(
+            [
+                feed_id
+                for feed_id in feed_ids
+                if feed_id not in locked_feed_ids
+            ]
+        )
+
+
+def ingest_feeds(feeds: list[Feed], session: Session):
+    """
+    Runs a batch of feeds through the ingestion stages: all documents are
+    fetched concurrently, the changed ones are parsed on the parse process
+    pool, then the new entries of each feed are stored with one INSERT.
+    New entries are fanned out to subscribers by fan_out_feed_changes_task,
+    triggered once per batch.
+    """
+    fetch_results = asyncio.run(fetch_feeds(feeds))
+    mark_feeds_refreshed([feed.id for feed in feeds])
+
+    changed_feeds = []
+    for feed, fetch_result in zip(feeds, fetch_results):
+        if isinstance(fetch_result, BaseException):
+            logger.warning(
+                "Fetching feed %s failed: %r", feed.id, fetch_result,
+            )
+            schedule_retry_poll(
+                feed,
+                get_error_response_headers(fetch_result),
+                session,
+            )
+        elif not skip_unchanged_fetch_result(feed, fetch_result, session):
+            changed_feeds.append((feed, fetch_result))
+
+    if not changed_feeds:
+        return
+
+    recent_guids = get_recent_guids(
+        [feed.id for feed, _ in changed_feeds],
+        session,
+    )
+    parsed_feeds = parse_feeds(
+        [
+            get_parse_job(
+                fetch_result,
+                recent_guids.get(feed.id, frozenset()),
+            )
+            for feed, fetch_result in changed_feeds
+        ],
+        processes=settings.feed_parse_processes,
+        **get_parse_options(),
+    )
+
+    has_new_entries = False
+    for (feed, fetch_result), parsed_feed in zip(changed_feeds, parsed_feeds):
+        if isinstance(parsed_feed, BaseException):
+            logger.warning(
+                "Feed %s could not be parsed: %r", feed.id, parsed_feed,
+            )
+            schedule_retry_poll(feed, fetch_result.headers, session)
+            continue
+
+        if store_parsed_feed(feed, fetch_result, parsed_feed, session):
+            has_new_entries = True
+
+    if has_new_entries:
+        fan_out_feed_changes_task.delay()
+
+
+@celery_app.task(base=BaseTaskWithRetry)
+def update_feeds_batch_task(feed_ids: list[int]):
+    with Session(engine) as session:
+        update_feeds(feed_ids, session)
+
+
+@celery_app.task(base=BaseTaskWithRetry)
+def refresh_user_feeds_task(user_id: int, feed_ids: list[int]):
+    """
+    Fetches the claimed feeds of a user triggered refresh, then brings all
+    of the user's subscriptions up to date, including those whose feeds
+    were fetched by someone else.
+    """
+    with Session(engine) as session:
+        update_feeds(feed_ids, session, wait=True)
+
+        statement = select(FeedSubscription.id).where(
+            FeedSubscription.user_id == user_id,
+        )
+        results = session.exec(statement)
+        update_entries_for_subscriptions(results.all(), session)
+
+
+def enqueue_user_feeds_refresh(user_id: int, session: Session) -> AsyncResult:
+    """
+    Starts a refresh of the user's feeds. The owner of the job is stored
+    before the job is queued, only the owner can look it up. Responds
+    with 503 when it can not be stored.
+    """
+    job_id = str(uuid4())
+    try:
+        redis_client.set(
+            get_refresh_job_key(job_id),
+            user_id,
+            ex=settings.refresh_job_ttl_seconds,
+        )
+    except redis.RedisError:
+        logger.warning("Could not store the owner of refresh job %s", job_id)
+        raise_refresh_jobs_unavailable()
+
+    statement = select(FeedSubscription.feed_id).join(Feed).where(
+        FeedSubscription.user_id == user_id,
+        Feed.is_active == True,  # noqa
+    )
+    results = session.exec(statement)
+    feed_ids = claim_feeds_for_refresh(results.all())
+
+    return refresh_user_feeds_task.apply_async(
+        (user_id, feed_ids),
+        task_id=job_id,
+    )
+
+
+def get_refresh_job_key(job_id: str) -> str:
+    return f"refresh-job:{job_id}"
+
+
+def get_job_status(job_id: str, user_id: int) -> str | None:
+    """
+    Status of the user's refresh job, None for jobs of other users.
+    Responds with 503 when the owner of the job can not be looked up.
+    """
+    try:
+        owner_id = redis_client.get(get_refresh_job_key(job_id))
+    except redis.RedisError:
+        logger.warning("Could not look up the owner of refresh job %s", job_id)
+        raise_refresh_jobs_unavailable()
+
+    if owner_id is None or int(owner_id) != user_id:
+        return None
+
+    return AsyncResult(job_id, app=celery_app).status
+
+
+def raise_refresh_jobs_unavailable():
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Refresh jobs are not available, try again later.",
+    )
+
+
+@celery_app.task(base=BaseTaskWithRetry)
+def fan_out_feed_changes_task():
+    with Session(engine) as session:
+        limit = settings.feed_change_fan_out_limit
+        processed_count = fan_out_feed_changes(session, limit)
+
+    # more events are pending, continue in a new task
+    if processed_count == limit:
+        fan_out_feed_changes_task.delay()
+
+    return processed_count
 
 
 # subtask
@@ -62,46 +370,151 @@ def update_subscription_task(feed_subscription_id: int):
         subscription = results.first()
 
         if subscription:
-            update_entries_for_feed(
-                feed=subscription,
-                db_session=session,
-                mark_subscriptions_for_update=True,
-            )
+            update_subscription_entries(subscription, session)
+
+
+def dispatch_in_batches(task: Task, ids: list[int], batch_size: int):
+    """
+    Sends the ids as one group of batch tasks, each taking a list of ids,
+    instead of one message per id.
+    """
+    if ids:
+        group(
+            task.s(list(batch)) for batch in batched(ids, batch_size)
+        ).apply_async()
+
+
+@celery_app.task(base=BaseTaskWithRetry)
+def update_subscriptions_batch_task(subscription_ids: list[int]):
+    with Session(engine) as session:
+        update_entries_for_subscriptions(subscription_ids, session)
 
 
 # subtask
 @celery_app.task(base=BaseTaskWithRetry)
 def update_subscriptions_of_a_user(user_id: int):
     with Session(engine) as session:
-        statement = select(FeedSubscription).where(
+        statement = select(FeedSubscription.id).where(
             FeedSubscription.user_id == user_id,
         )
         results = session.exec(statement)
-        subscriptions = results.all()
+        update_entries_for_subscriptions(results.all(), session)
 
-        for subscription in subscriptions:
-            update_subscription_task.delay(subscription.id)
 
-
-# periodic task
+# full resync of all subscriptions, subscriptions of changed feeds are
+# kept up to date by fan_out_feed_changes_task
 @celery_app.task(base=BaseTaskWithRetry)
 def update_all_user_subscriptions():
     with Session(engine) as session:
-        statement = select(User).where(User.is_active == True)  # noqa
+        statement = select(FeedSubscription.id).join(User).where(
+            User.is_active == True,  # noqa
+        ).order_by(FeedSubscription.feed_id)
         results = session.exec(statement)
-        all_users = results.all()
+        subscription_ids = results.all()
+
+    # ordered by feed so that a batch needs as few fan-outs as possible
+    dispatch_in_batches(
+        update_subscriptions_batch_task,
+        subscription_ids,
+        settings.subscription_update_batch_size,
+    )
+
+
+def claim_due_feeds(session: Session, limit: int) -> list[int]:
+    """
+    Returns up to limit active feeds whose next poll is due, most overdue
+    first. Their next poll is pushed back by feed_dispatch_lease_seconds so
+    that the following beat runs do not dispatch them again while they are
+    being fetched, a lost batch is retried once the lease expires.
+    """
+    now = utc_now()
+    due_feed_ids = (
+        select(Feed.id)
+        .where(
+            Feed.is_active == True,  # noqa
+            Feed.next_poll_at <= now,
+        )
+        .order_by(Feed.next_poll_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Feed)
+        .where(Feed.id.in_(due_feed_ids.scalar_subquery()))
+        .values(
+            next_poll_at=now + timedelta(
+                seconds=settings.feed_dispatch_lease_seconds,
+            ),
+        )
+        .returning(Feed.id)
+    )
+    feed_ids = session.exec(statement).scalars().all()
+    session.commit()
 
-        for user in all_users:
-            update_subscriptions_of_a_user.delay(user.id)
+    return feed_ids
 
 
 # periodic task
 @celery_app.task(base=BaseTaskWithRetry)
+def dispatch_due_feeds():
+    with Session(engine) as session:
+        feed_ids = claim_due_feeds(session, settings.feed_dispatch_limit)
+
+    dispatch_in_batches(
+        update_feeds_batch_task,
+        feed_ids,
+        settings.feed_fetch_batch_size,
+    )
+
+    return len(feed_ids)
+
+
+# polls every active feed regardless of its schedule
+@celery_app.task(base=BaseTaskWithRetry)
 def update_all_feeds():
     with Session(engine) as session:
-        statement = select(Feed).where(Feed.is_active == True)  # noqa
+        statement = select(Feed.id).where(Feed.is_active == True)  # noqa
         results = session.exec(statement)
-        feeds = results.all()
+        feed_ids = results.all()
+
+    dispatch_in_batches(
+        update_feeds_batch_task,
+        feed_ids,
+        settings.feed_fetch_batch_size,
+    )
+
+
+# periodic task, removes entries the retention policies expire
+@celery_app.task(base=BaseTaskWithRetry)
+def prune_feed_entries_task() -> dict:
+    started_at = time.monotonic()
+    with Session(engine) as session:
+        removed_entry_count, removed_user_entry_count = (
+            prune_expired_feed_entries(
+                session,
+                settings.entry_retention_batch_size,
+            )
+        )
+    seconds = round(time.monotonic() - started_at, 3)
+
+    logger.info(
+        "Removed %s feed entries and %s user feed entries in %s seconds",
+        removed_entry_count,
+        removed_user_entry_count,
+        seconds,
+    )
+    return {
+        "removed_entries": removed_entry_count,
+        "removed_user_entries": removed_user_entry_count,
+        "seconds": seconds,
+    }
+
+
+# one-off task, run before enabling settings.lazy_read_state
+@celery_app.task
+def migrate_to_lazy_read_state_task():
+    with Session(engine) as session:
+        deleted_count = migrate_to_lazy_read_state(session)
 
-        for feed in feeds:
-            update_entries_for_feed_task.delay(feed.id)
+    logger.info("Removed %s materialized user feed entries", deleted_count)
+    return deleted_count
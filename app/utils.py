@@ -1,3 +1,12 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable
+
+
 # converts a dictionary to an object
 class DictToObject:
     def __init__(self, dictionary):
@@ -9,3 +18,75 @@ class DictToObject:
 
     def __getattr__(self, attr):
         return self.__dict__.get(attr, None)
+
+
+# encodes keyset pagination values into an opaque string
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# raises ValueError for anything encode_cursor did not produce
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+
+
+# keyset values of search results, ranks are floats
+def encode_search_cursor(rank: float, id: int) -> str:
+    raw = json.dumps([rank, id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# raises ValueError for anything encode_search_cursor did not produce
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, id = json.loads(base64.urlsafe_b64decode(cursor))
+        return float(rank), int(id)
+    except (TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+
+
+# in-process cache, entries expire ttl_seconds after they are set and the
+# least recently used ones are evicted beyond max_size. Thread safe, sync
+# endpoints are served from a thread pool
+class TTLCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,38 +1,65 @@
 from typing import Annotated
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import (
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from app.models import (
     Feed,
     FeedSubscription,
     User,
-    UserFeedEntry,
     create_db_and_tables,
+    get_async_db_session,
     get_db_session,
 )
+from app.etags import get_not_modified_response
+from app.cache import invalidate_user_caches_async
 from app.model_helpers import (
+    count_unread_user_feed_entries,
     create_feed_in_database,
     create_feed_subscription_with_feed_id,
+    get_feeds_version,
+    get_subscriptions_version,
+    get_user_feed_entries_version,
+    get_user_feed_entry_out,
+    list_user_feed_entries,
+    mark_user_feed_entries_read,
+    search_user_feed_entries,
+    set_user_feed_entry_read_state,
     unscubscribe_from_feed,
-    update_entries_for_feed,
-    update_subscription_entries,
 )
 from app.schemas import (
     FeedIn,
     FeedOut,
+    MarkedCountOut,
+    RefreshJobOut,
     Token,
+    UnreadCountsOut,
+    UserFeedEntryIdsIn,
     UserFeedEntryOut,
+    UserFeedEntryPage,
     UserIn,
     UserOut,
 )
 from app.security import (
+    Principal,
     authenticate_user,
     create_access_token,
     get_current_active_user,
     hash_password,
+    run_password_hashing,
 )
+from app.tasks import enqueue_user_feeds_refresh, get_job_status
 
 
 def lifespan(app: FastAPI):
@@ -47,12 +74,14 @@ app = FastAPI(lifespan=lifespan)
 
 
 @app.post("/register", response_model=UserOut, status_code=201)
-def register_user(
+async def register_user(
     user_in: UserIn,
     db_session: Session = Depends(get_db_session),
 ) -> UserOut:
+    # blocking database calls stay off the event loop, hashing runs on
+    # the password hashing pool
     statement = select(User).where(User.username == user_in.username)
-    results = db_session.exec(statement)
+    results = await run_in_threadpool(db_session.exec, statement)
     existing_user = results.first()
 
     if existing_user:
@@ -61,7 +90,10 @@ def register_user(
             status_code=400,
         )
 
-    hashed_password = hash_password(user_in.password)
+    hashed_password = await run_password_hashing(
+        hash_password,
+        user_in.password,
+    )
     user = User(
         username=user_in.username,
         full_name=user_in.full_name,
@@ -69,18 +101,18 @@ def register_user(
     )
 
     db_session.add(user)
-    db_session.commit()
-    db_session.refresh(user)
+    await run_in_threadpool(db_session.commit)
+    await run_in_threadpool(db_session.refresh, user)
 
     return UserOut.model_validate(user)
 
 
 @app.post("/token")
-def login(
+async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     db_session: Session = Depends(get_db_session),
 ) -> Token:
-    user: User | None = authenticate_user(
+    user: User | None = await authenticate_user(
         db_session,
         form_data.username,
         form_data.password,
@@ -93,21 +125,23 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = create_access_token(username=user.username)
+    access_token = create_access_token(user)
     return Token(access_token=access_token, token_type="bearer")
 
 
 @app.get("/users/me/", response_model=UserOut)
 def read_users_me(
-    current_user: Annotated[User, Depends(get_current_active_user)]
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: Session = Depends(get_db_session),
 ):
-    return UserOut.model_validate(current_user)
+    user = db_session.get(User, current_user.id)
+    return UserOut.model_validate(user)
 
 
 @app.post("/feed", response_model=FeedOut, status_code=201)
 def create_feed(
     feed_in: FeedIn,
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ) -> FeedOut:
     feed: Feed = create_feed_in_database(feed_in, db_session)
@@ -116,9 +150,19 @@ def create_feed(
 
 @app.get("/feed", response_model=list[FeedOut])
 def get_feeds(
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    request: Request,
+    response: Response,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ) -> list[FeedOut]:
+    not_modified = get_not_modified_response(
+        request,
+        response,
+        *get_feeds_version(db_session),
+    )
+    if not_modified:
+        return not_modified
+
     statement = select(Feed)
     results = db_session.exec(statement)
     feeds = results.all()
@@ -129,19 +173,26 @@ def get_feeds(
 @app.get("/feed/{feed_id}", response_model=FeedOut)
 def get_feed(
     feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    request: Request,
+    response: Response,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ) -> FeedOut:
-    statement = select(Feed).where(Feed.id == feed_id)
+    statement = select(Feed.id).where(Feed.id == feed_id)
     results = db_session.exec(statement)
-    feed = results.first()
 
-    if not feed:
+    if not results.first():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Feed not found.",
         )
 
+    # the columns FeedOut shows do not change once a feed is created
+    not_modified = get_not_modified_response(request, response)
+    if not_modified:
+        return not_modified
+
+    feed = db_session.get(Feed, feed_id)
     return FeedOut.model_validate(feed)
 
 
@@ -152,7 +203,7 @@ def get_feed(
 )
 def subscribe_to_feed(
     feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ) -> FeedSubscription:
     subscription = create_feed_subscription_with_feed_id(
@@ -162,11 +213,21 @@ def subscribe_to_feed(
     return subscription
 
 
-@app.get("me/subscriptions", response_model=list[FeedOut])
+@app.get("/me/subscriptions", response_model=list[FeedOut])
 def get_subscribed_feeds(
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    request: Request,
+    response: Response,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ) -> list[FeedOut]:
+    not_modified = get_not_modified_response(
+        request,
+        response,
+        *get_subscriptions_version(current_user, db_session),
+    )
+    if not_modified:
+        return not_modified
+
     statement = select(Feed).join(FeedSubscription).where(
         FeedSubscription.user_id == current_user.id
     )
@@ -182,7 +243,7 @@ def get_subscribed_feeds(
 )
 def unsubscribe_from_feed(
     feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
 ):
     unscubscribe_from_feed(
@@ -193,65 +254,47 @@ def unsubscribe_from_feed(
     return
 
 
-@app.get("/me/feed-entries", response_model=list[UserFeedEntryOut])
-def get_user_feed_entries(
-    current_user: Annotated[User, Depends(get_current_active_user)],
+@app.get("/me/feed-entries", response_model=UserFeedEntryPage)
+async def get_user_feed_entries(
+    request: Request,
+    response: Response,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     is_read: bool = False,
     order_by_date_desc: bool = True,
-    db_session: Session = Depends(get_db_session),
-) -> list[UserFeedEntryOut]:
-    statement = select(FeedSubscription).where(
-        FeedSubscription.user_id == current_user.id
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: str | None = None,
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> UserFeedEntryPage:
+    version = await db_session.run_sync(
+        lambda session: get_user_feed_entries_version(current_user, session),
     )
-    results = db_session.exec(statement)
-    subscriptions = results.all()
-
-    subscription_ids = [subscription.id for subscription in subscriptions]
+    not_modified = get_not_modified_response(request, response, *version)
+    if not_modified:
+        return not_modified
 
-    statement = select(UserFeedEntry).where(
-        UserFeedEntry.subscription_id.in_(subscription_ids),
-        UserFeedEntry.is_read == is_read,
-    ).order_by(
-        UserFeedEntry.created_at.desc()
-        if order_by_date_desc
-        else UserFeedEntry.created_at.asc()
+    return await list_user_feed_entries(
+        current_user,
+        is_read,
+        order_by_date_desc,
+        db_session,
+        limit=limit,
+        cursor=cursor,
     )
-    results = db_session.exec(statement)
-    user_feed_entries = results.all()
-
-    feed_list = []
-
-    for user_feed_entry in user_feed_entries:
-        entry_out = UserFeedEntryOut.model_validate(user_feed_entry.feed_entry)
-        entry_out.is_read = user_feed_entry.is_read
-        entry_out.id = user_feed_entry.id
-        feed_list.append(entry_out)
-
-    return feed_list
 
 
 @app.get("/me/feed-entries/{user_feed_id}", response_model=UserFeedEntryOut)
-def get_user_feed_entry(
+async def get_user_feed_entry(
     user_feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db_session: Session = Depends(get_db_session),
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: AsyncSession = Depends(get_async_db_session),
 ) -> UserFeedEntryOut:
-    statement = select(UserFeedEntry).where(
-        UserFeedEntry.id == user_feed_id,
+    return await db_session.run_sync(
+        lambda session: get_user_feed_entry_out(
+            current_user,
+            user_feed_id,
+            session,
+        ),
     )
-    results = db_session.exec(statement)
-    user_feed_entry = results.first()
-
-    if not user_feed_entry:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Feed entry not found.",
-        )
-
-    entry_out = UserFeedEntryOut.model_validate(user_feed_entry.feed_entry)
-    entry_out.is_read = user_feed_entry.is_read
-    entry_out.id = user_feed_entry.id
-    return entry_out
 
 
 @app.post(
@@ -259,31 +302,21 @@ def get_user_feed_entry(
     response_model=UserFeedEntryOut,
     status_code=200,
 )
-def mark_feed_entry_as_read(
+async def mark_feed_entry_as_read(
     user_feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db_session: Session = Depends(get_db_session),
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: AsyncSession = Depends(get_async_db_session),
 ) -> UserFeedEntryOut:
-    statement = select(UserFeedEntry).where(
-        UserFeedEntry.id == user_feed_id,
+    user_entry = await db_session.run_sync(
+        lambda session: set_user_feed_entry_read_state(
+            current_user,
+            user_feed_id,
+            True,
+            session,
+        ),
     )
-    results = db_session.exec(statement)
-    user_feed_entry = results.first()
-
-    if not user_feed_entry:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Feed entry not found.",
-        )
-
-    user_feed_entry.is_read = True
-    db_session.commit()
-    db_session.refresh(user_feed_entry)
-
-    entry_out = UserFeedEntryOut.model_validate(user_feed_entry.feed_entry)
-    entry_out.is_read = user_feed_entry.is_read
-    entry_out.id = user_feed_entry.id
-    return entry_out
+    await invalidate_user_caches_async([current_user.id])
+    return user_entry
 
 
 @app.post(
@@ -291,49 +324,152 @@ def mark_feed_entry_as_read(
     response_model=UserFeedEntryOut,
     status_code=200,
 )
-def mark_feed_entry_as_unread(
+async def mark_feed_entry_as_unread(
     user_feed_id: int,
-    current_user: Annotated[User, Depends(get_current_active_user)],
-    db_session: Session = Depends(get_db_session),
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: AsyncSession = Depends(get_async_db_session),
 ) -> UserFeedEntryOut:
-    statement = select(UserFeedEntry).where(
-        UserFeedEntry.id == user_feed_id,
+    user_entry = await db_session.run_sync(
+        lambda session: set_user_feed_entry_read_state(
+            current_user,
+            user_feed_id,
+            False,
+            session,
+        ),
     )
-    results = db_session.exec(statement)
-    user_feed_entry = results.first()
+    await invalidate_user_caches_async([current_user.id])
+    return user_entry
 
-    if not user_feed_entry:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Feed entry not found.",
-        )
 
-    user_feed_entry.is_read = False
-    db_session.commit()
-    db_session.refresh(user_feed_entry)
+@app.post(
+    "/me/feed-entries/read",
+    response_model=MarkedCountOut,
+    status_code=200,
+)
+async def mark_feed_entries_as_read(
+    entry_ids_in: UserFeedEntryIdsIn,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> MarkedCountOut:
+    count = await db_session.run_sync(
+        lambda session: mark_user_feed_entries_read(
+            current_user,
+            session,
+            entry_ids=entry_ids_in.ids,
+        ),
+    )
+    await invalidate_user_caches_async([current_user.id])
+    return MarkedCountOut(count=count)
 
-    entry_out = UserFeedEntryOut.model_validate(user_feed_entry.feed_entry)
-    entry_out.is_read = user_feed_entry.is_read
-    entry_out.id = user_feed_entry.id
-    return entry_out
+
+@app.post(
+    "/me/feed-entries/read-all",
+    response_model=MarkedCountOut,
+    status_code=200,
+)
+async def mark_all_feed_entries_as_read(
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    up_to_id: int | None = None,
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> MarkedCountOut:
+    count = await db_session.run_sync(
+        lambda session: mark_user_feed_entries_read(
+            current_user,
+            session,
+            up_to_id=up_to_id,
+        ),
+    )
+    await invalidate_user_caches_async([current_user.id])
+    return MarkedCountOut(count=count)
 
 
 @app.post(
-    "/me/feed-entries/refresh",
+    "/me/subscriptions/{subscription_id}/read-all",
+    response_model=MarkedCountOut,
     status_code=200,
 )
+async def mark_all_subscription_entries_as_read(
+    subscription_id: int,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    up_to_id: int | None = None,
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> MarkedCountOut:
+    def mark_subscription_entries_read(session: Session) -> int:
+        statement = select(FeedSubscription.id).where(
+            FeedSubscription.id == subscription_id,
+            FeedSubscription.user_id == current_user.id,
+        )
+        results = session.exec(statement)
+
+        if not results.first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Subscription not found.",
+            )
+
+        return mark_user_feed_entries_read(
+            current_user,
+            session,
+            subscription_id=subscription_id,
+            up_to_id=up_to_id,
+        )
+
+    count = await db_session.run_sync(mark_subscription_entries_read)
+    await invalidate_user_caches_async([current_user.id])
+    return MarkedCountOut(count=count)
+
+
+@app.get("/me/unread-counts", response_model=UnreadCountsOut)
+async def get_unread_counts(
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> UnreadCountsOut:
+    return await count_unread_user_feed_entries(current_user, db_session)
+
+
+@app.get("/me/search", response_model=UserFeedEntryPage)
+async def search_feed_entries(
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: str | None = None,
+    db_session: AsyncSession = Depends(get_async_db_session),
+) -> UserFeedEntryPage:
+    return await db_session.run_sync(
+        lambda session: search_user_feed_entries(
+            current_user,
+            q,
+            session,
+            limit=limit,
+            cursor=cursor,
+        ),
+    )
+
+
+@app.post(
+    "/me/feed-entries/refresh",
+    response_model=RefreshJobOut,
+    status_code=202,
+)
 def refresh_user_feed_entries(
-    current_user: Annotated[User, Depends(get_current_active_user)],
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
     db_session: Session = Depends(get_db_session),
-):
-    statement = select(FeedSubscription).where(
-        FeedSubscription.user_id == current_user.id
-    )
-    results = db_session.exec(statement)
-    subscriptions = results.all()
+) -> RefreshJobOut:
+    job = enqueue_user_feeds_refresh(current_user.id, db_session)
+    return RefreshJobOut(job_id=job.id, status=job.status)
 
-    for subscription in subscriptions:
-        update_entries_for_feed(subscription.feed, db_session)
-        update_subscription_entries(subscription, db_session)
 
-    return
+@app.get("/me/feed-entries/refresh/{job_id}", response_model=RefreshJobOut)
+def get_refresh_job(
+    job_id: str,
+    current_user: Annotated[Principal, Depends(get_current_active_user)],
+) -> RefreshJobOut:
+    job_status = get_job_status(job_id, current_user.id)
+
+    if job_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Refresh job not found.",
+        )
+
+    return RefreshJobOut(job_id=job_id, status=job_status)
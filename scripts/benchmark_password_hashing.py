@@ -0,0 +1,88 @@
+"""
+Measures the logins per second password verification allows at several
+bcrypt costs, on one core and on a pool of threads like the one logins
+use (see app.security.run_password_hashing). Use it to pick
+settings.password_hash_rounds and settings.password_hash_workers.
+
+usage:
+    python -m scripts.benchmark_password_hashing --rounds 10 11 12 13
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.security import get_password_context
+from settings import settings
+
+
+PASSWORD = "benchmark-password"
+
+
+def measure_logins_per_second(
+    rounds: int,
+    workers: int,
+    duration: float,
+) -> float:
+    password_context = get_password_context(rounds)
+    hashed_password = password_context.hash(PASSWORD)
+
+    def login(deadline: float) -> int:
+        count = 0
+        while time.monotonic() < deadline:
+            # what authenticate_user runs for every login
+            password_context.verify_and_update(PASSWORD, hashed_password)
+            count += 1
+        return count
+
+    started_at = time.monotonic()
+    deadline = started_at + duration
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(login, [deadline] * workers))
+
+    return sum(counts) / (time.monotonic() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        nargs="+",
+        default=[10, 11, 12, 13],
+        help="bcrypt costs to measure",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.password_hash_workers,
+        help="threads of the pool measurement",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=3.0,
+        help="seconds spent on each measurement",
+    )
+    arguments = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}, pool workers: {arguments.workers}")
+    print(
+        f"{'rounds':>6} {'ms/login':>9} {'logins/s/core':>14} "
+        f"{'logins/s pool':>14}"
+    )
+    for rounds in arguments.rounds:
+        per_core = measure_logins_per_second(rounds, 1, arguments.duration)
+        pool = measure_logins_per_second(
+            rounds,
+            arguments.workers,
+            arguments.duration,
+        )
+        print(
+            f"{rounds:>6} {1000 / per_core:>9.1f} {per_core:>14.1f} "
+            f"{pool:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,109 @@ class Settings(BaseSettings):
     postgres_host: str
     postgres_port: int
     redis_host: str = "redis://localhost:6379/0"
+    redis_socket_timeout_seconds: float = 1.0
     postgres_test_db: str = "test"
+    # connections of the sync engine, per process, see app.models.engine
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # connections are replaced after this, before the database, a
+    # firewall or PgBouncer's server_lifetime drops them
+    db_pool_recycle_seconds: int = 30 * 60
+    # connections are checked with a round trip when taken from the pool,
+    # ones dropped by a database restart are replaced instead of failing
+    db_pool_pre_ping: bool = True
+    # connecting through PgBouncer in transaction pooling mode, which does
+    # not keep prepared statements between transactions
+    db_pgbouncer_transaction_pooling: bool = False
+    # connections of the async engine used by the read and mark
+    # endpoints, see app.models.async_engine
+    async_db_pool_size: int = 20
+    async_db_max_overflow: int = 20
+    # prepared statements cached per connection, 0 turns the cache off.
+    # Ignored with db_pgbouncer_transaction_pooling
+    async_db_statement_cache_size: int = 100
 
     secret: str = "secret"
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 60
+    # users of valid tokens are looked up once per ttl per process, a
+    # deactivation reaches other processes within it
+    principal_cache_ttl_seconds: int = 30
+    principal_cache_max_size: int = 10000
+    # bcrypt cost factor, passwords hashed with another one are rehashed
+    # on their next login
+    password_hash_rounds: int = 12
+    # threads hashing passwords, each one keeps a core busy
+    password_hash_workers: int = 2
+    # hashes queued or running before logins are turned away with 503
+    password_hash_max_pending: int = 32
+
+    feed_fetch_timeout_seconds: float = 30.0
+    feed_fetch_user_agent: str = "rss-reader/0.1"
+    feed_fetch_max_connections: int = 100
+    feed_fetch_max_connections_per_host: int = 4
+    feed_fetch_batch_size: int = 200
+    # larger documents are cut off, only their first entries are read
+    feed_fetch_max_bytes: int = 5 * 1024 * 1024
+    # new entries stored per poll, the newest ones win
+    feed_parse_max_entries: int = 500
+    # entries read at a time, a chunk that reaches a known entry is the
+    # last one read
+    feed_parse_chunk_size: int = 50
+    # processes parsing feed documents of a batch in parallel, 0 parses in
+    # the worker itself. Celery's prefork workers can not start processes,
+    # run ingest workers with --pool threads or solo to use this
+    feed_parse_processes: int = 0
+    subscription_update_batch_size: int = 1000
+    # feeds with pending change events fanned out per task run
+    feed_change_fan_out_limit: int = 1000
+    # user triggered refreshes skip feeds fetched more recently than this
+    feed_refresh_min_interval_seconds: int = 120
+    # refresh jobs can be looked up by their user this long, as long as
+    # Celery keeps results by default
+    refresh_job_ttl_seconds: int = 24 * 60 * 60
+    # only one worker updates a feed at a time, see app.locks. The ttl
+    # has to outlast fetching, parsing and storing a batch of feeds
+    feed_lock_ttl_seconds: int = 10 * 60
+    feed_lock_wait_seconds: int = 60
+
+    # adaptive polling, see app.scheduling
+    feed_poll_min_interval_seconds: int = 5 * 60
+    feed_poll_max_interval_seconds: int = 24 * 60 * 60
+    feed_poll_default_interval_seconds: int = 60 * 60
+    feed_poll_error_interval_seconds: int = 30 * 60
+    # due feeds dispatched per beat run, and how long a dispatched feed
+    # is held back before it is considered lost and dispatched again
+    feed_dispatch_limit: int = 10000
+    feed_dispatch_lease_seconds: int = 15 * 60
+
+    # first unread page and unread counts of users, see app.cache
+    user_cache_ttl_seconds: int = 5 * 60
+
+    # matches ranked per search, the newest ones, see
+    # app.model_helpers.search_user_feed_entries
+    search_max_candidates: int = 1000
+
+    # retention of feed entries, see app.tasks.prune_feed_entries_task.
+    # 0 keeps entries of any age or number, feeds can override both
+    entry_retention_max_age_days: int = 0
+    entry_retention_max_items_per_feed: int = 0
+    # the newest entries of a feed are always kept, at least
+    # feed_parse_max_entries of them. So are the entries its last parsed
+    # document lists, a feed still listing removed entries would store
+    # them again as new ones
+    entry_retention_min_items_per_feed: int = 100
+    # entries a user marked favorite or archived are kept
+    entry_retention_keep_favorites: bool = True
+    # entries removed per transaction, keeps locks short
+    entry_retention_batch_size: int = 1000
+    # copies removed entries into FeedEntryArchive, compressed
+    entry_retention_archive: bool = False
+
+    # derive read state from a per subscription read cursor instead of
+    # copying every entry into UserFeedEntry for each subscriber,
+    # see app.model_helpers.migrate_to_lazy_read_state
+    lazy_read_state: bool = False
 
     class Config:
         # last file will overwrite the previous ones
@@ -1,19 +1,20 @@
 from typing import Generator
 
-import feedparser
+import fakeredis
 import pytest
 from sqlalchemy import Engine
 from sqlmodel import SQLModel, Session, create_engine
 from fastapi.testclient import TestClient
+from app.fetcher import FetchResult
 from app.model_helpers import (
     update_entries_for_feed,
     update_subscription_entries,
 )
 from app.models import Feed, FeedSubscription, User, create_db_and_tables
-from app.security import create_access_token
+from app.security import create_access_token, principal_cache
 
 from main import app
-from app.models import get_db_session
+from app.models import get_async_db_session, get_db_session
 from settings import settings
 from tests.mock_data import sample_parser_raw_data
 
@@ -43,12 +44,47 @@ def session(engine: Engine) -> Generator[Session, None, None]:
     connection.close()
 
 
+# keeps cached values from leaking between tests through a local redis
+@pytest.fixture(scope="function", autouse=True)
+def fake_redis(mocker) -> Generator[fakeredis.FakeRedis, None, None]:
+    redis_client = fakeredis.FakeRedis()
+    mocker.patch("app.cache.redis_client", redis_client)
+    mocker.patch("app.locks.redis_client", redis_client)
+    mocker.patch("app.tasks.redis_client", redis_client)
+    yield redis_client
+
+
+# users cached by one test are rolled back with its transaction
+@pytest.fixture(scope="function", autouse=True)
+def clear_principal_cache() -> Generator[None, None, None]:
+    yield
+    principal_cache.clear()
+
+
+class SyncBackedAsyncSession:
+    """Runs the run_sync callbacks of async endpoints on the test session"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.session, *args, **kwargs)
+
+
 @pytest.fixture(scope="function")
 def client(session: Session) -> Generator[TestClient, None, None]:
     def get_session_override():
         return session
 
+    async def get_async_session_override():
+        # test data is never committed, async endpoints have to see it
+        # through the test session instead of a connection of their own
+        return SyncBackedAsyncSession(session)
+
     app.dependency_overrides[get_db_session] = get_session_override
+    app.dependency_overrides[get_async_db_session] = (
+        get_async_session_override
+    )
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
@@ -69,7 +105,7 @@ def test_user(session: Session) -> Generator[User, None, None]:
 
 @pytest.fixture(scope="function")
 def valid_auth_header(test_user: User) -> Generator[str, str, None]:
-    token = create_access_token(test_user.username)
+    token = create_access_token(test_user)
     yield {"Authorization": f"Bearer {token}"}
 
 
@@ -87,11 +123,12 @@ def test_feed(session: Session) -> Generator[Feed, None, None]:
 
 @pytest.fixture(scope="function")
 def set_up_feed(session: Session, test_feed, test_user, mocker):
-    parsed_object = feedparser.parse(sample_parser_raw_data)
-
     mocker.patch(
-        "app.model_helpers.feedparser.parse",
-        return_value=parsed_object,
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
     )
     update_entries_for_feed(test_feed, session)
     subscription = FeedSubscription(
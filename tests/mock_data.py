@@ -1,3 +1,7 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+
 sample_parser_response_fail = {
     "bozo": 1,
     "entries": [],
@@ -37,3 +41,23 @@ sample_parser_response_fail = {
 
 
 sample_parser_raw_data = """<?xml version="1.0" encoding="utf-8"?><rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:media="http://search.yahoo.com/mrss/"><channel><title>NU - Algemeen</title><link>https://www.nu.nl/algemeen</link><description>Het laatste nieuws het eerst op NU.nl</description><atom:link href="https://www.nu.nl/rss/Algemeen" rel="self"/><language>nl-nl</language><copyright>Copyright © 2024, NU</copyright><lastBuildDate>Mon, 11 Mar 2024 00:27:55 +0100</lastBuildDate><ttl>60</ttl><atom:logo>https://www.nu.nl/assets/favicon/nu_logo.svg</atom:logo><item><title>Joy Beune geniet op eigen wijze van wereldtitel: 'Moet van Kjeld vaker blij doen'</title><link>https://www.nu.nl/schaatsen/6304705/joy-beune-geniet-op-eigen-wijze-van-wereldtitel-moet-van-kjeld-vaker-blij-doen.html</link><description>Joy Beune sloot een droomseizoen zondag in stijl af. De 24-jarige schaatsster kroonde zich in Inzell voor het eerst tot wereldkampioen allround. "We gaan deze titel zo echt wel even vieren."</description><pubDate>Sun, 10 Mar 2024 18:45:50 +0100</pubDate><guid isPermaLink="false">article-6304705</guid><enclosure length="0" type="image/jpeg" url="https://media.nu.nl/m/rh6xiryacs6o_sqr256.jpg/joy-beune-geniet-op-eigen-wijze-van-wereldtitel-moet-van-kjeld-vaker-blij-doen.jpg"/><category>schaatsen</category><dc:rights>copyright photo: ANP</dc:rights></item><item><title>Weekweerbericht | Na regen komt zonneschijn (en mogelijk weer regen)</title><link>https://www.nu.nl/weerbericht/6304691/weekweerbericht-na-regen-komt-zonneschijn-en-mogelijk-weer-regen.html</link><description>De week start bewolkt en regenachtig. Wie uitkijkt naar de lente, kan vooral op donderdag genieten van het weer. Dan neemt de temperatuur toe en komt de zon regelmatig tevoorschijn. Vanaf vrijdag stijgt de kans op enkele buien opnieuw.</description><pubDate>Sun, 10 Mar 2024 15:21:26 +0100</pubDate><guid isPermaLink="false">article-6304691</guid><enclosure length="0" type="image/jpeg" url="https://media.nu.nl/m/424xkwuadvm9_sqr256.jpg/weekweerbericht-na-regen-komt-zonneschijn-en-mogelijk-weer-regen.jpg"/><category>weerbericht</category><dc:rights>copyright photo: Getty Images</dc:rights></item></channel></rss>"""  # noqa: E501
+
+
+def make_rss(item_count: int, oldest_first: bool = False) -> bytes:
+    """RSS document with item-0 published last, an hour before item-1"""
+    newest = datetime(2024, 3, 10, 22, tzinfo=timezone.utc)
+    item_numbers = range(item_count)
+    if oldest_first:
+        item_numbers = reversed(item_numbers)
+    items = "".join(
+        f"<item><title>Item {i}</title><link>/items/{i}</link>"
+        f"<description>&lt;p&gt;Item {i}&lt;script&gt;x&lt;/script&gt;"
+        f"&lt;/p&gt;</description><guid>item-{i}</guid>"
+        f"<pubDate>{format_datetime(newest - timedelta(hours=i))}</pubDate>"
+        "</item>"
+        for i in item_numbers
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+        f"<title>Example</title><ttl>30</ttl>{items}</channel></rss>"
+    ).encode()
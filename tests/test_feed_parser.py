@@ -0,0 +1,146 @@
+from datetime import datetime
+
+import pytest
+
+from app.feed_parser import (
+    FeedParseError,
+    FeedStream,
+    ParseJob,
+    parse_feed,
+    parse_feeds,
+)
+from tests.mock_data import make_rss
+
+
+def test_rss_entries():
+    stream = FeedStream(make_rss(2), base_url="https://example.com/rss")
+    entries = list(stream.entries())
+
+    assert [entry.guid for entry in entries] == ["item-0", "item-1"]
+    assert entries[0].title == "Item 0"
+    assert entries[0].link == "https://example.com/items/0"
+    assert entries[0].summary == "<p>Item 0</p>"
+    assert entries[0].description == entries[0].summary
+    assert entries[0].publish_date == datetime(2024, 3, 10, 22, 0)
+    assert stream.feed_info == {"ttl": "30"}
+
+
+def test_rss_1_entries():
+    content = b"""<?xml version="1.0"?>
+    <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+             xmlns="http://purl.org/rss/1.0/"
+             xmlns:dc="http://purl.org/dc/elements/1.1/">
+      <channel rdf:about="https://example.com/">
+        <title>Example</title>
+      </channel>
+      <item rdf:about="https://example.com/1">
+        <title>First</title><link>https://example.com/1</link>
+        <dc:date>2024-03-10T10:00:00+01:00</dc:date>
+      </item>
+    </rdf:RDF>"""
+
+    [entry] = FeedStream(content).entries()
+
+    assert entry.guid == "https://example.com/1"
+    assert entry.title == "First"
+    assert entry.summary is None
+    assert entry.publish_date == datetime(2024, 3, 10, 9, 0)
+
+
+def test_atom_entries():
+    content = b"""<?xml version="1.0"?>
+    <feed xmlns="http://www.w3.org/2005/Atom">
+      <title>Example</title>
+      <entry>
+        <id>urn:1</id><title>First</title>
+        <link rel="edit" href="/edit/1"/><link href="/1"/>
+        <content type="html">&lt;b&gt;Body&lt;/b&gt;</content>
+        <published>2024-03-10T10:00:00Z</published>
+      </entry>
+      <entry><title>No id or link</title></entry>
+    </feed>"""
+
+    stream = FeedStream(content, base_url="https://example.com/feed")
+    [entry] = stream.entries()
+
+    assert entry.guid == "urn:1"
+    assert entry.link == "https://example.com/1"
+    assert entry.summary == "<b>Body</b>"
+    assert entry.publish_date == datetime(2024, 3, 10, 10, 0)
+
+
+def test_unsupported_documents():
+    with pytest.raises(FeedParseError):
+        list(FeedStream(b"<html><body>not a feed</body></html>").entries())
+    with pytest.raises(FeedParseError):
+        list(FeedStream(make_rss(2)[:-20]).entries())
+
+
+def test_truncated_document():
+    content = make_rss(3)
+    content = content[:content.index(b"<item><title>Item 2") + 30]
+
+    entries = list(FeedStream(content, truncated=True).entries())
+
+    assert [entry.guid for entry in entries] == ["item-0", "item-1"]
+
+
+def make_job(content: bytes, known_guids=frozenset()) -> ParseJob:
+    return ParseJob(
+        content=content,
+        headers={"content-type": "application/rss+xml"},
+        truncated=False,
+        known_guids=known_guids,
+    )
+
+
+def test_parse_feed_stops_at_known_entries():
+    job = make_job(make_rss(1000), frozenset({"item-3"}))
+
+    parsed_feed = parse_feed(job, max_entries=500, chunk_size=10)
+
+    assert [entry.guid for entry in parsed_feed.entries] == [
+        f"item-{i}" for i in range(10) if i != 3
+    ]
+    assert len(parsed_feed.publish_dates) == 10
+    assert parsed_feed.feed_info == {"ttl": "30"}
+
+
+def test_parse_feed_reads_undated_feeds_to_the_end():
+    items = "".join(
+        f"<item><title>Item {i}</title><link>/items/{i}</link>"
+        f"<guid>item-{i}</guid></item>"
+        for i in range(30)
+    )
+    content = (
+        '<?xml version="1.0" encoding="utf-8"?><rss version="2.0">'
+        f"<channel><title>Example</title>{items}</channel></rss>"
+    ).encode()
+    # older entries first, the new one is appended at the end
+    known_guids = frozenset(f"item-{i}" for i in range(29))
+
+    parsed_feed = parse_feed(
+        make_job(content, known_guids), max_entries=500, chunk_size=10,
+    )
+
+    assert [entry.guid for entry in parsed_feed.entries] == ["item-29"]
+
+
+def test_parse_feed_caps_entries():
+    parsed_feed = parse_feed(
+        make_job(make_rss(1000)), max_entries=25, chunk_size=10,
+    )
+
+    assert len(parsed_feed.entries) == 25
+
+
+def test_parse_feeds_on_a_process_pool():
+    jobs = [make_job(make_rss(3)), make_job(b"<html>not a feed")]
+
+    for processes in (0, 2):
+        parsed_feed, error = parse_feeds(
+            jobs, processes=processes, max_entries=10, chunk_size=10,
+        )
+
+        assert len(parsed_feed.entries) == 3
+        assert isinstance(error, FeedParseError)
@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.fetcher import AsyncFeedFetcher, fetch_feed
+from app.models import Feed
+from tests.mock_data import sample_parser_raw_data
+
+
+def make_client(handler) -> httpx.Client:
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_fetch_feed_sends_validators():
+    feed = Feed(
+        feed_url="https://example.com/rss",
+        feed_title="Example Feed",
+        etag='"abc"',
+        last_modified="Mon, 11 Mar 2024 00:27:55 GMT",
+    )
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(304)
+
+    result = fetch_feed(feed, make_client(handler))
+
+    assert result.not_modified
+    assert result.content == b""
+    assert requests[0].headers["If-None-Match"] == '"abc"'
+    assert requests[0].headers["If-Modified-Since"] == feed.last_modified
+
+
+def test_fetch_feed_without_validators():
+    feed = Feed(feed_url="https://example.com/rss", feed_title="Example")
+    content = sample_parser_raw_data.encode()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert "If-None-Match" not in request.headers
+        assert "If-Modified-Since" not in request.headers
+        return httpx.Response(
+            200,
+            content=content,
+            headers={"ETag": '"new"', "Last-Modified": "Tue"},
+        )
+
+    result = fetch_feed(feed, make_client(handler))
+
+    assert not result.not_modified
+    assert result.content == content
+    assert result.etag == '"new"'
+    assert result.last_modified == "Tue"
+
+
+def test_fetch_feed_error_status():
+    feed = Feed(feed_url="https://example.com/rss", feed_title="Example")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_feed(feed, make_client(handler))
+
+
+def test_fetch_feed_caps_document_size(mocker):
+    mocker.patch("app.fetcher.settings.feed_fetch_max_bytes", 100)
+    feed = Feed(feed_url="https://example.com/rss", feed_title="Example")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=b"x" * 1000)
+
+    result = fetch_feed(feed, make_client(handler))
+
+    assert result.content == b"x" * 100
+    assert result.truncated
+
+
+def test_async_fetcher_limits_concurrency_per_host():
+    feeds = [
+        Feed(feed_url=f"https://{host}/rss/{i}", feed_title="Example")
+        for host in ("a.example.com", "b.example.com")
+        for i in range(6)
+    ]
+    in_flight = {"a.example.com": 0, "b.example.com": 0}
+    peak = {"a.example.com": 0, "b.example.com": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        in_flight[host] += 1
+        peak[host] = max(peak[host], in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        if request.url.path.endswith("/5"):
+            return httpx.Response(500)
+        return httpx.Response(200, content=request.url.path.encode())
+
+    async def fetch_all():
+        async with AsyncFeedFetcher(
+            max_connections=10,
+            max_connections_per_host=2,
+            transport=httpx.MockTransport(handler),
+        ) as fetcher:
+            return await fetcher.fetch_many(feeds)
+
+    results = asyncio.run(fetch_all())
+
+    assert peak == {"a.example.com": 2, "b.example.com": 2}
+    for feed, result in zip(feeds, results):
+        if feed.feed_url.endswith("/5"):
+            assert isinstance(result, httpx.HTTPStatusError)
+        else:
+            assert result.content == httpx.URL(feed.feed_url).path.encode()
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import redis
+
+from app.locks import (
+    acquire_feed_locks,
+    release_feed_locks,
+    single_flight,
+    wait_for_feed_updates,
+)
+
+
+def test_single_flight(fake_redis):
+    with single_flight(1) as is_owner:
+        assert is_owner
+
+        with single_flight(1) as is_other_owner:
+            assert not is_other_owner
+        with single_flight(2) as is_other_owner:
+            assert is_other_owner
+
+    with single_flight(1) as is_owner:
+        assert is_owner
+
+
+def test_single_flight_waits_for_the_owner(fake_redis):
+    owner_is_done = threading.Event()
+
+    def update():
+        with single_flight(1):
+            time.sleep(0.3)
+            owner_is_done.set()
+
+    owner = threading.Thread(target=update)
+    owner.start()
+    time.sleep(0.05)
+
+    with single_flight(1, wait=True) as is_owner:
+        assert not is_owner
+        assert owner_is_done.is_set()
+
+    owner.join()
+
+
+def test_wait_gives_up(fake_redis, mocker):
+    mocker.patch("app.locks.settings.feed_lock_wait_seconds", 0.2)
+    acquire_feed_locks([1], "token")
+
+    assert not wait_for_feed_updates([1])
+    assert wait_for_feed_updates([2])
+
+
+def test_release_keeps_locks_taken_over(fake_redis):
+    assert acquire_feed_locks([1, 2], "token") == [1, 2]
+    # the lock of feed 2 expired and another worker took it
+    fake_redis.set("feed-lock:2", "other-token")
+
+    release_feed_locks([1, 2], "token")
+
+    assert fake_redis.get("feed-lock:1") is None
+    assert fake_redis.get("feed-lock:2") == b"other-token"
+
+
+def test_locks_without_redis(mocker):
+    mocker.patch(
+        "app.locks.redis_client",
+        redis.Redis.from_url("redis://localhost:1/0"),
+    )
+
+    assert acquire_feed_locks([1, 2], "token") == [1, 2]
+    release_feed_locks([1, 2], "token")
+    with single_flight(1) as is_owner:
+        assert is_owner
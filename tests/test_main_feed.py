@@ -1,7 +1,12 @@
+import asyncio
+
 import feedparser
+import redis
 from pydantic_core import Url
+from sqlalchemy import event
 from sqlmodel import select
-from app.models import Feed, FeedSubscription, User
+from app.models import Feed, FeedEntry, FeedSubscription, User
+from app.security import create_access_token, principal_cache
 
 from app.utils import DictToObject
 from tests.mock_data import (
@@ -99,6 +104,34 @@ def test_get_feeds(client, session, valid_auth_header):
     assert json_list[0]["feed_description"] == feed.feed_description
 
 
+def test_get_feeds_not_modified(client, session, valid_auth_header):
+    response = client.get("/feed", headers=valid_auth_header)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    response = client.get(
+        "/feed",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    session.add(Feed(
+        feed_url="https://example.com/feed",
+        feed_title="Example Feed",
+    ))
+    session.commit()
+    response = client.get(
+        "/feed",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.headers["etag"] != etag
+
+
 def test_get_feed_with_id_fails(client, valid_auth_header):
     response = client.get(
         "/feed/1",
@@ -129,6 +162,35 @@ def test_get_feed_with_id(client, session, valid_auth_header):
     assert json_dict["feed_description"] == feed.feed_description
 
 
+def test_get_feed_not_modified(client, session, valid_auth_header):
+    feed = Feed(
+        feed_url="https://example.com/feed",
+        feed_title="Example Feed",
+    )
+    session.add(feed)
+    session.commit()
+
+    response = client.get(f"/feed/{feed.id}", headers=valid_auth_header)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    # the strong form of the tag matches too, among others
+    response = client.get(
+        f"/feed/{feed.id}",
+        headers={
+            **valid_auth_header,
+            "If-None-Match": f'"other", {etag.removeprefix("W/")}',
+        },
+    )
+    assert response.status_code == 304
+
+    response = client.get(
+        f"/feed/{feed.id + 1}",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 404
+
+
 def test_create_feed_subscription_not_authorized(client):
     response = client.post(
         "/feed/1/subscribe",
@@ -178,6 +240,36 @@ def test_create_feed_subscription_success(
     assert json_dict["id"] == feed_subscription.id
 
 
+def test_create_feed_subscription_lists_existing_entries(
+    client,
+    session,
+    test_feed: Feed,
+    valid_auth_header,
+):
+    session.add_all([
+        FeedEntry(
+            feed_id=test_feed.id,
+            title=f"Entry {i}",
+            link=f"https://testfeed.com/{i}",
+            guid=f"entry-{i}",
+        )
+        for i in range(2)
+    ])
+    session.commit()
+
+    response = client.post(
+        f"/feed/{test_feed.id}/subscribe",
+        headers=valid_auth_header,
+        json={},
+    )
+    assert response.status_code == 201
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert len(response.json()["items"]) == 2
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 2
+
+
 def test_create_feed_subscription_already_exists(
     client,
     session,
@@ -202,6 +294,43 @@ def test_create_feed_subscription_already_exists(
     assert response.json()["detail"] == "Subscription already exists."
 
 
+def test_get_subscribed_feeds(
+    client,
+    test_feed: Feed,
+    valid_auth_header,
+):
+    response = client.get("/me/subscriptions", headers=valid_auth_header)
+    assert response.status_code == 200
+    assert response.json() == []
+    etag = response.headers["etag"]
+
+    response = client.get(
+        "/me/subscriptions",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+    client.post(f"/feed/{test_feed.id}/subscribe", headers=valid_auth_header)
+    response = client.get(
+        "/me/subscriptions",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert [feed["id"] for feed in response.json()] == [test_feed.id]
+    etag = response.headers["etag"]
+
+    client.delete(
+        f"/feed/{test_feed.id}/unsubscribe",
+        headers=valid_auth_header,
+    )
+    response = client.get(
+        "/me/subscriptions",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
 def test_unsubscribe_from_feed(
     client,
     session,
@@ -258,8 +387,9 @@ def test_get_user_feed_entries(
         headers=valid_auth_header,
     )
     assert response.status_code == 200
-    json_list = response.json()
+    json_list = response.json()["items"]
     assert len(json_list) == 2
+    assert response.json()["next_cursor"] is None
 
     for entry in json_list:
         assert entry["feed_id"] == feed.id
@@ -269,6 +399,134 @@ def test_get_user_feed_entries(
         assert entry["is_read"] is False
 
 
+def test_get_user_feed_entries_pagination(
+    client,
+    valid_auth_header,
+    set_up_feed,
+):
+    subscription = set_up_feed[2]
+    expected_ids = sorted(
+        (user_entry.id for user_entry in subscription.user_feed_entries),
+        reverse=True,
+    )
+
+    response = client.get(
+        "/me/feed-entries",
+        headers=valid_auth_header,
+        params={"limit": 1},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [entry["id"] for entry in first_page["items"]] == expected_ids[:1]
+    assert first_page["next_cursor"] is not None
+
+    response = client.get(
+        "/me/feed-entries",
+        headers=valid_auth_header,
+        params={"limit": 1, "cursor": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert [entry["id"] for entry in second_page["items"]] == expected_ids[1:]
+    assert second_page["next_cursor"] is None
+
+
+def test_get_user_feed_entries_statement_count(
+    client,
+    engine,
+    session,
+    valid_auth_header,
+    set_up_feed,
+):
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    statement_counts = []
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        for limit in (1, 2):
+            # nothing may come from the identity map of the fixtures or
+            # from the principal cache
+            session.expire_all()
+            principal_cache.clear()
+            statements.clear()
+            response = client.get(
+                "/me/feed-entries",
+                headers=valid_auth_header,
+                params={"limit": limit},
+            )
+            assert len(response.json()["items"]) == limit
+            statement_counts.append(len(statements))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert statement_counts[0] == statement_counts[1]
+
+
+def test_get_user_feed_entries_not_modified(
+    client,
+    engine,
+    session,
+    valid_auth_header,
+    set_up_feed,
+):
+    subscription = set_up_feed[2]
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    etag = response.headers["etag"]
+
+    # the etag belongs to the query it was returned for
+    response = client.get(
+        "/me/feed-entries",
+        headers={**valid_auth_header, "If-None-Match": etag},
+        params={"is_read": True},
+    )
+    assert response.status_code == 200
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get(
+            "/me/feed-entries",
+            headers={**valid_auth_header, "If-None-Match": etag},
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+    assert response.status_code == 304
+    # the version check reads no entries
+    assert not any("userfeedentry" in statement for statement in statements)
+
+    client.post(
+        f"/me/feed-entries/{subscription.user_feed_entries[0].id}/read",
+        headers=valid_auth_header,
+    )
+    response = client.get(
+        "/me/feed-entries",
+        headers={**valid_auth_header, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 1
+
+
+def test_get_user_feed_entries_invalid_cursor(
+    client,
+    valid_auth_header,
+    set_up_feed,
+):
+    response = client.get(
+        "/me/feed-entries",
+        headers=valid_auth_header,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
+
+
 def test_mark_feed_entry_as_read(
     client,
     test_user: User,
@@ -317,6 +575,74 @@ def test_mark_feed_entry_as_unread(
     assert user_entry.is_read is False
 
 
+def test_mark_feed_entries_as_read(
+    client,
+    valid_auth_header,
+    set_up_feed,
+    session,
+):
+    subscription = set_up_feed[2]
+    entry_ids = [entry.id for entry in subscription.user_feed_entries]
+
+    response = client.post(
+        "/me/feed-entries/read",
+        headers=valid_auth_header,
+        json={"ids": entry_ids},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+
+    # already read entries are not counted again
+    response = client.post(
+        "/me/feed-entries/read",
+        headers=valid_auth_header,
+        json={"ids": entry_ids},
+    )
+    assert response.json() == {"count": 0}
+
+    session.expire_all()
+    assert all(entry.is_read for entry in subscription.user_feed_entries)
+
+
+def test_mark_all_feed_entries_as_read(
+    client,
+    valid_auth_header,
+    set_up_feed,
+):
+    subscription = set_up_feed[2]
+    entry_ids = sorted(entry.id for entry in subscription.user_feed_entries)
+
+    response = client.post(
+        "/me/feed-entries/read-all",
+        headers=valid_auth_header,
+        params={"up_to_id": entry_ids[0]},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+    response = client.post(
+        f"/me/subscriptions/{subscription.id}/read-all",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert response.json()["items"] == []
+
+
+def test_mark_all_subscription_entries_as_read_not_found(
+    client,
+    valid_auth_header,
+):
+    response = client.post(
+        "/me/subscriptions/1/read-all",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Subscription not found."
+
+
 def test_get_user_feed_entry(
     client,
     test_user: User,
@@ -338,20 +664,510 @@ def test_get_user_feed_entry(
     assert json_dict["is_read"] == user_entry.is_read
 
 
+def test_feed_entry_of_other_user_not_found(
+    client,
+    session,
+    set_up_feed,
+):
+    user_entry = set_up_feed[2].user_feed_entries[0]
+    other_user = User(
+        username="otheruser",
+        password="securepassword",
+        full_name="Other User",
+    )
+    session.add(other_user)
+    session.commit()
+    token = create_access_token(other_user)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get(
+        f"/me/feed-entries/{user_entry.id}",
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+    response = client.post(
+        f"/me/feed-entries/{user_entry.id}/read",
+        headers=headers,
+    )
+    assert response.status_code == 404
+    session.refresh(user_entry)
+    assert user_entry.is_read is False
+
+
 def test_refresh_user_feed_entries(
     client,
     test_user: User,
     valid_auth_header,
     set_up_feed,
+    fake_redis,
     mocker,
 ):
+    feed = set_up_feed[0]
     mocker.patch(
-        "app.model_helpers.feedparser.parse",
-        return_value=feedparser.parse(sample_parser_raw_data),
+        "app.tasks.claim_feeds_for_refresh",
+        side_effect=lambda feed_ids: feed_ids,
+    )
+    mocked_apply_async = mocker.patch(
+        "app.tasks.refresh_user_feeds_task.apply_async",
+        side_effect=lambda args, task_id: mocker.Mock(
+            id=task_id,
+            status="PENDING",
+        ),
     )
 
     response = client.post(
         "/me/feed-entries/refresh",
         headers=valid_auth_header,
     )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.json()["status"] == "PENDING"
+    mocked_apply_async.assert_called_once_with(
+        (test_user.id, [feed.id]),
+        task_id=job_id,
+    )
+    assert fake_redis.get(f"refresh-job:{job_id}") == (
+        str(test_user.id).encode()
+    )
+
+
+def test_refresh_user_feed_entries_without_feed_claims(
+    client,
+    test_user: User,
+    valid_auth_header,
+    set_up_feed,
+    fake_redis,
+    mocker,
+):
+    feed = set_up_feed[0]
+    mocker.patch.object(
+        fake_redis,
+        "pipeline",
+        side_effect=redis.ConnectionError,
+    )
+    mocked_apply_async = mocker.patch(
+        "app.tasks.refresh_user_feeds_task.apply_async",
+        return_value=mocker.Mock(id="job-id", status="PENDING"),
+    )
+
+    response = client.post(
+        "/me/feed-entries/refresh",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 202
+    mocked_apply_async.assert_called_once_with(
+        (test_user.id, [feed.id]),
+        task_id=mocker.ANY,
+    )
+
+
+def test_refresh_user_feed_entries_without_job_owner(
+    client,
+    valid_auth_header,
+    set_up_feed,
+    fake_redis,
+    mocker,
+):
+    mocker.patch.object(fake_redis, "set", side_effect=redis.ConnectionError)
+    mocked_apply_async = mocker.patch(
+        "app.tasks.refresh_user_feeds_task.apply_async",
+    )
+
+    response = client.post(
+        "/me/feed-entries/refresh",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 503
+    mocked_apply_async.assert_not_called()
+
+
+def test_get_refresh_job(
+    client,
+    session,
+    test_user: User,
+    valid_auth_header,
+    fake_redis,
+    mocker,
+):
+    mocker.patch(
+        "app.tasks.AsyncResult",
+        return_value=mocker.Mock(status="SUCCESS"),
+    )
+    fake_redis.set("refresh-job:job-id", test_user.id)
+
+    response = client.get(
+        "/me/feed-entries/refresh/job-id",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 200
+    assert response.json() == {"job_id": "job-id", "status": "SUCCESS"}
+
+    other_user = User(
+        username="otheruser",
+        password="securepassword",
+        full_name="Other User",
+    )
+    session.add(other_user)
+    session.commit()
+    response = client.get(
+        "/me/feed-entries/refresh/job-id",
+        headers={
+            "Authorization": f"Bearer {create_access_token(other_user)}",
+        },
+    )
+    assert response.status_code == 404
+
+    mocker.patch.object(fake_redis, "get", side_effect=redis.ConnectionError)
+    response = client.get(
+        "/me/feed-entries/refresh/job-id",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 503
+
+
+def test_lazy_read_state_feed_entries(
+    client,
+    session,
+    valid_auth_header,
+    set_up_feed,
+    mocker,
+):
+    mocker.patch("app.model_helpers.settings.lazy_read_state", True)
+    feed, _, subscription = set_up_feed
+    # only exceptions are stored in lazy mode
+    for user_entry in subscription.user_feed_entries:
+        session.delete(user_entry)
+    session.commit()
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert response.status_code == 200
+    json_list = response.json()["items"]
+    assert len(json_list) == 2
+    entry_ids = {entry.id for entry in feed.feed_entries}
+    assert {entry["id"] for entry in json_list} == entry_ids
+
+    entry_id = json_list[0]["id"]
+    response = client.post(
+        f"/me/feed-entries/{entry_id}/read",
+        headers=valid_auth_header,
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == entry_id
+    assert response.json()["is_read"] is True
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert [
+        entry["id"] for entry in response.json()["items"]
+    ] == [json_list[1]["id"]]
+
+    # entries below the read cursor are read unless marked otherwise
+    subscription.read_cursor_entry_id = max(entry_ids)
+    session.commit()
+    response = client.post(
+        f"/me/feed-entries/{json_list[1]['id']}/unread",
+        headers=valid_auth_header,
+    )
+    assert response.json()["is_read"] is False
+
+    response = client.get(
+        "/me/feed-entries",
+        headers=valid_auth_header,
+        params={"is_read": True},
+    )
+    assert [entry["id"] for entry in response.json()["items"]] == [entry_id]
+
+
+def test_lazy_read_state_mark_all_read(
+    client,
+    session,
+    valid_auth_header,
+    set_up_feed,
+    mocker,
+):
+    mocker.patch("app.model_helpers.settings.lazy_read_state", True)
+    feed, _, subscription = set_up_feed
+    for user_entry in subscription.user_feed_entries:
+        session.delete(user_entry)
+    session.commit()
+    newer_id, older_id = sorted(
+        (entry.id for entry in feed.feed_entries),
+        reverse=True,
+    )
+
+    response = client.post(
+        "/me/feed-entries/read",
+        headers=valid_auth_header,
+        json={"ids": [newer_id]},
+    )
+    assert response.json() == {"count": 1}
+
+    response = client.post(
+        "/me/feed-entries/read-all",
+        headers=valid_auth_header,
+    )
+    assert response.json() == {"count": 1}
+
+    session.refresh(subscription)
+    assert subscription.read_cursor_entry_id == newer_id
+    assert subscription.user_feed_entries == []
+
+    response = client.post(
+        f"/me/feed-entries/{older_id}/unread",
+        headers=valid_auth_header,
+    )
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert [entry["id"] for entry in response.json()["items"]] == [older_id]
+
+
+def test_first_unread_page_is_cached(
+    client,
+    valid_auth_header,
+    set_up_feed,
+    session,
+):
+    subscription = set_up_feed[2]
+    user_entry = subscription.user_feed_entries[0]
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert len(response.json()["items"]) == 2
+
+    # changes that bypass the helpers are not seen until the cache expires
+    user_entry.is_read = True
+    session.add(user_entry)
+    session.commit()
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert len(response.json()["items"]) == 2
+
+    # changes made through the helpers invalidate it
+    client.post(
+        f"/me/feed-entries/{user_entry.id}/read",
+        headers=valid_auth_header,
+    )
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert [entry["id"] for entry in response.json()["items"]] == [
+        entry.id
+        for entry in subscription.user_feed_entries
+        if entry.id != user_entry.id
+    ]
+
+
+def test_get_unread_counts(
+    client,
+    valid_auth_header,
+    set_up_feed,
+):
+    feed, _, subscription = set_up_feed
+    entry_id = subscription.user_feed_entries[0].id
+
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
     assert response.status_code == 200
+    assert response.json() == {
+        "total": 2,
+        "subscriptions": [{
+            "subscription_id": subscription.id,
+            "feed_id": feed.id,
+            "unread_count": 2,
+        }],
+    }
+
+    client.post(
+        "/me/feed-entries/read",
+        headers=valid_auth_header,
+        json={"ids": [entry_id]},
+    )
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 1
+
+    # marking an entry that is already read changes nothing
+    client.post(f"/me/feed-entries/{entry_id}/read", headers=valid_auth_header)
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 1
+
+    client.post(
+        f"/me/feed-entries/{entry_id}/unread",
+        headers=valid_auth_header,
+    )
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 2
+
+    client.post("/me/feed-entries/read-all", headers=valid_auth_header)
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 0
+
+
+def test_lazy_read_state_unread_counts(
+    client,
+    session,
+    valid_auth_header,
+    set_up_feed,
+    mocker,
+):
+    mocker.patch("app.model_helpers.settings.lazy_read_state", True)
+    feed, _, subscription = set_up_feed
+    for user_entry in subscription.user_feed_entries:
+        session.delete(user_entry)
+    session.commit()
+    newer_id, older_id = sorted(
+        (entry.id for entry in feed.feed_entries),
+        reverse=True,
+    )
+
+    def get_total():
+        response = client.get("/me/unread-counts", headers=valid_auth_header)
+        return response.json()["total"]
+
+    assert get_total() == 2
+
+    client.post(
+        f"/me/feed-entries/{newer_id}/read",
+        headers=valid_auth_header,
+    )
+    assert get_total() == 1
+
+    client.post(
+        "/me/feed-entries/read-all",
+        headers=valid_auth_header,
+        params={"up_to_id": older_id},
+    )
+    assert get_total() == 0
+
+    client.post(
+        f"/me/feed-entries/{older_id}/unread",
+        headers=valid_auth_header,
+    )
+    assert get_total() == 1
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert [entry["id"] for entry in response.json()["items"]] == [older_id]
+
+
+def test_user_cache_without_redis(
+    client,
+    valid_auth_header,
+    set_up_feed,
+    mocker,
+):
+    mocker.patch(
+        "app.cache.redis_client",
+        redis.Redis.from_url("redis://localhost:1/0"),
+    )
+
+    response = client.get("/me/feed-entries", headers=valid_auth_header)
+    assert len(response.json()["items"]) == 2
+    response = client.post(
+        "/me/feed-entries/read-all",
+        headers=valid_auth_header,
+    )
+    assert response.json() == {"count": 2}
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.json()["total"] == 0
+
+
+def test_search_feed_entries(
+    client,
+    session,
+    valid_auth_header,
+    set_up_feed,
+):
+    subscription = set_up_feed[2]
+    ids_by_title = {
+        user_entry.feed_entry.title.split()[0]: user_entry.id
+        for user_entry in subscription.user_feed_entries
+    }
+
+    # "regen" is twice in one title, it ranks above a single match
+    response = client.get(
+        "/me/search",
+        headers=valid_auth_header,
+        params={"q": "wereldtitel or regen", "limit": 1},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [entry["id"] for entry in first_page["items"]] == [
+        ids_by_title["Weekweerbericht"],
+    ]
+    assert first_page["items"][0]["is_read"] is False
+
+    response = client.get(
+        "/me/search",
+        headers=valid_auth_header,
+        params={
+            "q": "wereldtitel or regen",
+            "limit": 1,
+            "cursor": first_page["next_cursor"],
+        },
+    )
+    second_page = response.json()
+    assert [entry["id"] for entry in second_page["items"]] == [
+        ids_by_title["Joy"],
+    ]
+    assert second_page["next_cursor"] is None
+
+    response = client.get(
+        "/me/search",
+        headers=valid_auth_header,
+        params={"q": "zonneschijn -regen"},
+    )
+    assert response.json() == {"items": [], "next_cursor": None}
+
+
+def test_search_feed_entries_of_other_users(
+    client,
+    session,
+    set_up_feed,
+):
+    other_user = User(
+        username="otheruser",
+        password="securepassword",
+        full_name="Other User",
+    )
+    session.add(other_user)
+    session.commit()
+    session.refresh(other_user)
+
+    response = client.get(
+        "/me/search",
+        headers={
+            "Authorization": f"Bearer {create_access_token(other_user)}",
+        },
+        params={"q": "regen"},
+    )
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+
+def test_user_cache_stays_off_the_event_loop(
+    client,
+    valid_auth_header,
+    set_up_feed,
+    fake_redis,
+    mocker,
+):
+    def is_on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    redis_calls_on_loop = []
+    get = fake_redis.get
+    mocker.patch.object(
+        fake_redis,
+        "get",
+        side_effect=lambda key: (
+            redis_calls_on_loop.append(is_on_event_loop()) or get(key)
+        ),
+    )
+    invalidate = mocker.patch(
+        "app.cache.invalidate_user_caches",
+        side_effect=lambda user_ids: redis_calls_on_loop.append(
+            is_on_event_loop(),
+        ),
+    )
+
+    client.get("/me/feed-entries", headers=valid_auth_header)
+    client.post("/me/feed-entries/read-all", headers=valid_auth_header)
+
+    invalidate.assert_called_once()
+    assert redis_calls_on_loop and not any(redis_calls_on_loop)
@@ -1,5 +1,16 @@
+import threading
+
+from jose import jwt
+from sqlalchemy import event
+
 from app.models import User
-from app.security import hash_password
+from app.security import (
+    create_access_token,
+    get_password_context,
+    hash_password,
+    verify_password,
+)
+from settings import settings
 
 
 def test_register_user_success(client):
@@ -77,3 +88,125 @@ def test_read_users_me_not_authenticated(client):
     response = client.get("/users/me/")
     assert response.status_code == 401
     assert response.json()["detail"] == "Not authenticated"
+
+
+def test_access_token_claims(test_user):
+    token = create_access_token(test_user)
+    payload = jwt.decode(
+        token,
+        settings.secret,
+        algorithms=[settings.jwt_algorithm],
+    )
+    assert payload["sub"] == test_user.username
+    assert payload["uid"] == test_user.id
+    assert payload["active"] is True
+
+
+def test_authenticated_user_is_cached(
+    client,
+    engine,
+    test_user,
+    valid_auth_header,
+):
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    user_lookup_counts = []
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        for _ in range(2):
+            statements.clear()
+            response = client.get(
+                "/me/unread-counts",
+                headers=valid_auth_header,
+            )
+            assert response.status_code == 200
+            user_lookup_counts.append(len([
+                statement
+                for statement in statements
+                if 'FROM "user"' in statement
+            ]))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    # only the first request reads the user
+    assert user_lookup_counts == [1, 0]
+
+
+def test_deactivated_user_is_rejected(
+    client,
+    session,
+    test_user,
+    valid_auth_header,
+):
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.status_code == 200
+
+    test_user.is_active = False
+    session.add(test_user)
+    session.commit()
+
+    response = client.get("/me/unread-counts", headers=valid_auth_header)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Inactive user"
+
+    # tokens issued to inactive users are turned away from the claims
+    token = create_access_token(test_user)
+    response = client.get(
+        "/me/unread-counts",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
+
+
+def test_token_without_user_id_is_rejected(client, test_user):
+    token = jwt.encode(
+        {"sub": test_user.username},
+        settings.secret,
+        algorithm=settings.jwt_algorithm,
+    )
+    response = client.get(
+        "/users/me/",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 401
+
+
+def test_login_rehashes_password(client, session):
+    password = "securepassword"
+    user = User(
+        username="rehashuser",
+        password=get_password_context(4).hash(password),
+        full_name="Rehash User",
+    )
+    session.add(user)
+    session.commit()
+
+    response = client.post("/token", data={
+        "username": "rehashuser",
+        "password": password,
+    })
+    assert response.status_code == 200
+    assert "access_token" in response.json()
+
+    session.refresh(user)
+    rounds = f"${settings.password_hash_rounds:02d}$"
+    assert user.password.startswith(f"$2b{rounds}")
+    assert verify_password(password, user.password)
+
+
+def test_register_user_overloaded(client, mocker):
+    mocker.patch(
+        "app.security.password_hash_slots",
+        threading.BoundedSemaphore(1),
+    ).acquire()
+
+    response = client.post("/register", json={
+        "username": "testuser",
+        "password": "securepassword",
+        "full_name": "Test User",
+    })
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
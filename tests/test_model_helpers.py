@@ -1,15 +1,51 @@
-import feedparser
+import asyncio
+import re
+
+from datetime import timedelta
+
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.fetcher import FetchResult
 from app.model_helpers import (
+    fan_out_feed_changes,
+    decompress_archived_entry,
+    fan_out_feed_entries,
+    get_recent_guids,
+    ingest_fetch_result,
+    list_user_feed_entries,
+    migrate_to_lazy_read_state,
+    prune_expired_feed_entries,
     update_entries_for_feed,
+    update_entries_for_subscriptions,
     update_subscription_entries,
 )
-from app.models import Feed, FeedEntry, FeedSubscription, UserFeedEntry
-from tests.mock_data import sample_parser_raw_data
+from app.scheduling import utc_now
+from app.security import Principal
+from app.models import (
+    Feed,
+    FeedChangeEvent,
+    FeedEntry,
+    FeedEntryArchive,
+    FeedSubscription,
+    User,
+    UserFeedEntry,
+)
+from settings import settings
+from tests.mock_data import make_rss, sample_parser_raw_data
 
 
 def test_update_entries_for_feed(session, mocker):
-    parsed_object = feedparser.parse(sample_parser_raw_data)
+    fetch_result = FetchResult(
+        status_code=200,
+        content=sample_parser_raw_data.encode(),
+        headers={
+            "content-type": "application/rss+xml; charset=utf-8",
+            "etag": '"abc"',
+            "last-modified": "Mon, 11 Mar 2024",
+        },
+    )
 
     # Create a mock feed and entries
     feed = Feed(
@@ -21,14 +57,14 @@ def test_update_entries_for_feed(session, mocker):
     session.commit()
     session.refresh(feed)
 
-    mocked_parser = mocker.patch(
-        "app.model_helpers.feedparser.parse",
-        return_value=parsed_object,
+    mocked_fetch = mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=fetch_result,
     )
 
     update_entries_for_feed(feed, session)
 
-    mocked_parser.assert_called_once_with(feed.feed_url)
+    mocked_fetch.assert_called_once_with(feed)
 
     statement = select(FeedEntry).where(FeedEntry.feed_id == feed.id)
     results = session.exec(statement)
@@ -47,9 +83,168 @@ def test_update_entries_for_feed(session, mocker):
     assert entries[1].publish_date is not None
     assert entries[1].summary is not None
 
+    session.refresh(feed)
+    assert feed.etag == '"abc"'
+    assert feed.last_modified == "Mon, 11 Mar 2024"
+    assert feed.content_hash == fetch_result.content_hash
+
+
+def test_update_entries_for_feed_skips_existing_entries(
+    session,
+    test_feed,
+    mocker,
+):
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+
+    # a changed document that still contains both known items
+    test_feed.content_hash = None
+    update_entries_for_feed(test_feed, session)
+
+    statement = select(FeedEntry).where(FeedEntry.feed_id == test_feed.id)
+    entries = session.exec(statement).all()
+    assert len(entries) == 2
+    assert {entry.guid for entry in entries} == {
+        "article-6304705",
+        "article-6304691",
+    }
+
+
+def test_update_entries_for_feed_guids_are_scoped_per_feed(
+    session,
+    test_feed,
+    mocker,
+):
+    other_feed = Feed(
+        feed_url="https://example.com/rss",
+        feed_title="Example Feed",
+    )
+    session.add(other_feed)
+    session.commit()
+    session.refresh(other_feed)
+
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+    update_entries_for_feed(other_feed, session)
+
+    for feed in (test_feed, other_feed):
+        statement = select(FeedEntry).where(FeedEntry.feed_id == feed.id)
+        assert len(session.exec(statement).all()) == 2
+
+
+def test_update_entries_for_feed_not_modified(session, test_feed, mocker):
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(status_code=304),
+    )
+    mocked_parser = mocker.patch("app.model_helpers.feedparser.parse")
+
+    update_entries_for_feed(test_feed, session)
+
+    mocked_parser.assert_not_called()
+    statement = select(FeedEntry).where(FeedEntry.feed_id == test_feed.id)
+    assert session.exec(statement).all() == []
+    # only the schedule moves forward
+    assert test_feed.poll_interval_seconds == (
+        settings.feed_poll_default_interval_seconds
+    )
+    assert test_feed.next_poll_at > utc_now()
+
+
+def test_update_entries_for_feed_same_content(session, test_feed, mocker):
+    fetch_result = FetchResult(
+        status_code=200,
+        content=sample_parser_raw_data.encode(),
+    )
+    test_feed.content_hash = fetch_result.content_hash
+    session.add(test_feed)
+    session.commit()
+
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=fetch_result,
+    )
+    mocked_parser = mocker.patch("app.model_helpers.feedparser.parse")
+
+    update_entries_for_feed(test_feed, session)
+
+    mocked_parser.assert_not_called()
+
+
+def test_ingest_stops_at_known_entries(session, test_feed, mocker):
+    mocker.patch("app.model_helpers.settings.feed_parse_chunk_size", 10)
+    fetch_result = FetchResult(status_code=200, content=make_rss(20))
+    ingest_fetch_result(test_feed, fetch_result, session)
+    # the newest entries are the ones stored last
+    assert get_recent_guids([test_feed.id], session) == {
+        test_feed.id: frozenset(f"item-{i}" for i in range(10)),
+    }
+
+    # 3 new entries, then the 20 known ones and a long history
+    def rename(match: re.Match) -> bytes:
+        i = int(match.group(1))
+        if i < 3:
+            return f"<guid>new-item-{i}</guid>".encode()
+        if i < 23:
+            return f"<guid>item-{i - 3}</guid>".encode()
+        return f"<guid>old-item-{i}</guid>".encode()
+
+    content = re.sub(rb"<guid>item-(\d+)</guid>", rename, make_rss(1000))
+    new_entry_count = ingest_fetch_result(
+        test_feed, FetchResult(status_code=200, content=content), session,
+    )
+
+    # stopped at the first chunk, which reaches known entries
+    assert new_entry_count == 3
+
+
+def test_ingest_caps_new_entries(session, test_feed, mocker):
+    mocker.patch("app.model_helpers.settings.feed_parse_chunk_size", 10)
+    mocker.patch("app.model_helpers.settings.feed_parse_max_entries", 15)
+
+    fetch_result = FetchResult(status_code=200, content=make_rss(100))
+    new_entry_count = ingest_fetch_result(test_feed, fetch_result, session)
+
+    assert new_entry_count == 15
+    statement = select(FeedEntry.guid).where(
+        FeedEntry.feed_id == test_feed.id,
+    )
+    assert set(session.exec(statement).all()) == {
+        f"item-{i}" for i in range(15)
+    }
+
+
+def test_ingest_falls_back_to_feedparser(session, test_feed):
+    content = b"""<?xml version="1.0"?>
+    <feed version="0.3" xmlns="http://purl.org/atom/ns#">
+      <title>Example</title>
+      <entry>
+        <id>urn:1</id><title>First</title>
+        <link rel="alternate" href="https://example.com/1"/>
+      </entry>
+    </feed>"""
+    fetch_result = FetchResult(
+        status_code=200,
+        content=content,
+        headers={"content-type": "application/atom+xml"},
+    )
+
+    assert ingest_fetch_result(test_feed, fetch_result, session) == 1
+
 
 def test_update_subscription_entries(session, test_user, mocker):
-    parsed_object = feedparser.parse(sample_parser_raw_data)
 
     # Create a mock feed and entries
     feed = Feed(
@@ -62,8 +257,11 @@ def test_update_subscription_entries(session, test_user, mocker):
     session.refresh(feed)
 
     mocker.patch(
-        "app.model_helpers.feedparser.parse",
-        return_value=parsed_object,
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
     )
 
     update_entries_for_feed(feed, session)
@@ -94,3 +292,405 @@ def test_update_subscription_entries(session, test_user, mocker):
     assert user_feed_entries[1].feed_entry_id is not None
     assert user_feed_entries[1].subscription_id == subscription.id
     assert not user_feed_entries[1].is_read
+
+
+def test_fan_out_feed_entries(session, test_user, test_feed, mocker):
+    other_user = User(
+        username="otheruser",
+        password="securepassword",
+        full_name="Other User",
+    )
+    session.add(other_user)
+    session.commit()
+
+    subscriptions = [
+        FeedSubscription(user_id=user.id, feed_id=test_feed.id)
+        for user in (test_user, other_user)
+    ]
+    session.add_all(subscriptions)
+    session.commit()
+
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+
+    assert fan_out_feed_entries(test_feed.id, session) == 4
+    # nothing newer than the high-water marks
+    assert fan_out_feed_entries(test_feed.id, session) == 0
+
+    statement = select(func.max(FeedEntry.id)).where(
+        FeedEntry.feed_id == test_feed.id,
+    )
+    max_entry_id = session.exec(statement).one()
+    for subscription in subscriptions:
+        session.refresh(subscription)
+        assert subscription.last_entry_id == max_entry_id
+        assert len(subscription.user_feed_entries) == 2
+        assert subscription.unread_count == 2
+
+    # entries below the mark are not copied again, even when missing
+    session.delete(subscriptions[0].user_feed_entries[0])
+    session.commit()
+    assert fan_out_feed_entries(test_feed.id, session) == 0
+
+
+def test_lazy_fan_out_counts_unread_entries(
+    session,
+    test_user,
+    test_feed,
+    mocker,
+):
+    mocker.patch("app.model_helpers.settings.lazy_read_state", True)
+    subscription = FeedSubscription(user_id=test_user.id, feed_id=test_feed.id)
+    session.add(subscription)
+    session.commit()
+
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=make_rss(3),
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+    entry_ids = sorted(entry.id for entry in test_feed.feed_entries)
+
+    # entries are listed before they are fanned out, and may be read
+    session.add(UserFeedEntry(
+        subscription_id=subscription.id,
+        feed_entry_id=entry_ids[-1],
+        is_read=True,
+    ))
+    session.commit()
+
+    # nothing is copied, but the mark moves and the count follows
+    assert fan_out_feed_entries(test_feed.id, session) == 0
+    session.refresh(subscription)
+    assert subscription.last_entry_id == entry_ids[-1]
+    assert subscription.unread_count == 2
+    assert len(subscription.user_feed_entries) == 1
+
+
+def test_fan_out_feed_changes(session, test_user, test_feed, mocker):
+    idle_feed = Feed(
+        feed_url="https://idle.example.com/rss",
+        feed_title="Idle Feed",
+    )
+    session.add(idle_feed)
+    session.commit()
+    subscriptions = [
+        FeedSubscription(user_id=test_user.id, feed_id=feed.id)
+        for feed in (test_feed, idle_feed)
+    ]
+    session.add_all(subscriptions)
+    session.commit()
+
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+            headers={"content-type": "application/rss+xml"},
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+
+    statement = select(FeedChangeEvent)
+    events = session.exec(statement).all()
+    assert [(event.feed_id, event.max_entry_id) for event in events] == [
+        (test_feed.id, max(entry.id for entry in test_feed.feed_entries)),
+    ]
+
+    mocked_fan_out = mocker.patch(
+        "app.model_helpers.fan_out_feed_entries",
+        wraps=fan_out_feed_entries,
+    )
+    assert fan_out_feed_changes(session) == 1
+    mocked_fan_out.assert_called_once_with(test_feed.id, session)
+
+    for subscription in subscriptions:
+        session.refresh(subscription)
+    assert len(subscriptions[0].user_feed_entries) == 2
+    assert subscriptions[1].user_feed_entries == []
+    assert session.exec(statement).all() == []
+
+    # no events, no work
+    assert fan_out_feed_changes(session) == 0
+    mocked_fan_out.assert_called_once()
+
+
+def test_update_entries_for_subscriptions(session, test_user, mocker):
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+            headers={"content-type": "application/rss+xml"},
+        ),
+    )
+    feeds = [
+        Feed(feed_url=f"https://{host}/rss", feed_title=host)
+        for host in ("a.example.com", "b.example.com")
+    ]
+    session.add_all(feeds)
+    session.commit()
+
+    subscriptions = []
+    for feed in feeds:
+        update_entries_for_feed(feed, session)
+        subscriptions.append(
+            FeedSubscription(user_id=test_user.id, feed_id=feed.id),
+        )
+    session.add_all(subscriptions)
+    session.commit()
+
+    subscription_ids = [subscription.id for subscription in subscriptions]
+    assert update_entries_for_subscriptions(subscription_ids, session) == 4
+    assert update_entries_for_subscriptions(subscription_ids, session) == 0
+
+
+def test_migrate_to_lazy_read_state(session, set_up_feed):
+    _, _, subscription = set_up_feed
+    newer_entry, older_entry = sorted(
+        subscription.user_feed_entries,
+        key=lambda user_entry: -user_entry.feed_entry_id,
+    )
+    older_entry.is_read = True
+    session.commit()
+    newer_entry_id = newer_entry.feed_entry_id
+    older_entry_id = older_entry.feed_entry_id
+
+    assert migrate_to_lazy_read_state(session) == 2
+
+    session.refresh(subscription)
+    assert subscription.read_cursor_entry_id == older_entry_id
+    assert subscription.user_feed_entries == []
+
+    # marking the older entry unread and the newer one read
+    session.add(UserFeedEntry(
+        subscription_id=subscription.id,
+        feed_entry_id=older_entry_id,
+        is_read=False,
+    ))
+    session.add(UserFeedEntry(
+        subscription_id=subscription.id,
+        feed_entry_id=newer_entry_id,
+        is_read=True,
+    ))
+    session.commit()
+
+    # moves the cursor below the unread entry, only the read one is left
+    assert migrate_to_lazy_read_state(session) == 1
+    session.refresh(subscription)
+    assert subscription.read_cursor_entry_id == older_entry_id - 1
+    assert [
+        user_entry.feed_entry_id
+        for user_entry in subscription.user_feed_entries
+    ] == [newer_entry_id]
+
+
+def test_list_user_feed_entries_on_async_session(engine, mocker):
+    mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
+    )
+
+    def set_up_feed(session):
+        user = User(username="asyncuser", password="-", full_name="Async")
+        feed = Feed(feed_url="https://asyncfeed.com/rss", feed_title="Feed")
+        session.add_all([user, feed])
+        session.flush()
+        update_entries_for_feed(feed, session)
+        subscription = FeedSubscription(user_id=user.id, feed_id=feed.id)
+        session.add(subscription)
+        session.flush()
+        update_subscription_entries(subscription, session)
+        return Principal(user.id, user.username, user.is_active)
+
+    async def list_pages():
+        async_engine = create_async_engine(
+            engine.url.set(drivername="postgresql+asyncpg"),
+        )
+        async with async_engine.connect() as connection:
+            transaction = await connection.begin()
+            db_session = AsyncSession(
+                bind=connection,
+                join_transaction_mode="create_savepoint",
+            )
+            user = await db_session.run_sync(set_up_feed)
+
+            pages = [await list_user_feed_entries(
+                user, db_session=db_session, limit=1,
+            )]
+            # the cursor binds a created_at datetime through asyncpg
+            pages.append(await list_user_feed_entries(
+                user,
+                db_session=db_session,
+                limit=1,
+                cursor=pages[0].next_cursor,
+            ))
+
+            await db_session.close()
+            await transaction.rollback()
+        await async_engine.dispose()
+        return pages
+
+    first_page, second_page = asyncio.run(list_pages())
+
+    assert len(first_page.items) == 1
+    assert first_page.next_cursor is not None
+    assert len(second_page.items) == 1
+    assert second_page.items[0].id < first_page.items[0].id
+    assert second_page.next_cursor is None
+
+
+def test_prune_expired_feed_entries(session, test_user, test_feed, mocker):
+    mocker.patch(
+        "app.model_helpers.settings.entry_retention_max_items_per_feed", 2,
+    )
+    mocker.patch(
+        "app.model_helpers.settings.entry_retention_min_items_per_feed", 1,
+    )
+    subscription = FeedSubscription(user_id=test_user.id, feed_id=test_feed.id)
+    session.add(subscription)
+    session.commit()
+
+    mocked_fetch = mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(status_code=200, content=make_rss(5)),
+    )
+    update_entries_for_feed(test_feed, session)
+    fan_out_feed_entries(test_feed.id, session)
+    # the feed stops listing its three oldest entries
+    mocked_fetch.return_value = FetchResult(
+        status_code=200,
+        content=make_rss(2),
+    )
+    update_entries_for_feed(test_feed, session)
+    mocker.patch("app.model_helpers.settings.feed_parse_max_entries", 1)
+    user_entries = sorted(
+        subscription.user_feed_entries,
+        key=lambda user_entry: user_entry.feed_entry_id,
+    )
+    # the oldest entry is a favorite, the next one is read
+    user_entries[0].is_favorite = True
+    user_entries[1].is_read = True
+    subscription.unread_count = 4
+    session.add_all([*user_entries[:2], subscription])
+    session.commit()
+    entries_version = subscription.entries_version
+
+    assert prune_expired_feed_entries(session, batch_size=1) == (2, 2)
+
+    statement = select(FeedEntry.title).where(
+        FeedEntry.feed_id == test_feed.id,
+    ).order_by(FeedEntry.id)
+    assert session.exec(statement).all() == ["Item 4", "Item 1", "Item 0"]
+    session.refresh(subscription)
+    assert subscription.unread_count == 3
+    assert subscription.entries_version > entries_version
+    assert session.exec(select(FeedEntryArchive)).all() == []
+
+
+def test_prune_expired_feed_entries_by_feed_policy(
+    session,
+    test_user,
+    test_feed,
+    mocker,
+):
+    mocker.patch("app.model_helpers.settings.lazy_read_state", True)
+    mocker.patch("app.model_helpers.settings.entry_retention_archive", True)
+    mocker.patch(
+        "app.model_helpers.settings.entry_retention_min_items_per_feed", 1,
+    )
+    # the global policy keeps everything, the feed's own does not
+    test_feed.retention_max_age_days = 30
+    subscription = FeedSubscription(user_id=test_user.id, feed_id=test_feed.id)
+    session.add_all([test_feed, subscription])
+    session.commit()
+
+    mocked_fetch = mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(status_code=200, content=make_rss(3)),
+    )
+    update_entries_for_feed(test_feed, session)
+    fan_out_feed_entries(test_feed.id, session)
+    mocked_fetch.return_value = FetchResult(
+        status_code=200,
+        content=make_rss(1),
+    )
+    update_entries_for_feed(test_feed, session)
+    mocker.patch("app.model_helpers.settings.feed_parse_max_entries", 1)
+    statement = update(FeedEntry).where(
+        FeedEntry.feed_id == test_feed.id,
+    ).values(created_at=utc_now() - timedelta(days=60))
+    session.execute(statement)
+    session.commit()
+
+    assert prune_expired_feed_entries(session) == (2, 0)
+
+    session.refresh(subscription)
+    assert subscription.unread_count == 1
+    archived_entries = session.exec(
+        select(FeedEntryArchive).order_by(FeedEntryArchive.id),
+    ).all()
+    assert [
+        decompress_archived_entry(entry.content)["title"]
+        for entry in archived_entries
+    ] == ["Item 2", "Item 1"]
+    assert all(entry.guid for entry in archived_entries)
+
+
+def test_prune_expired_feed_entries_keeps_listed_entries(
+    session,
+    test_user,
+    test_feed,
+    mocker,
+):
+    mocker.patch(
+        "app.model_helpers.settings.entry_retention_max_items_per_feed", 1,
+    )
+    mocker.patch(
+        "app.model_helpers.settings.entry_retention_min_items_per_feed", 1,
+    )
+    subscription = FeedSubscription(user_id=test_user.id, feed_id=test_feed.id)
+    session.add(subscription)
+    session.commit()
+
+    # an oldest first feed is read to the end on every poll
+    mocked_fetch = mocker.patch(
+        "app.model_helpers.fetch_feed",
+        return_value=FetchResult(
+            status_code=200,
+            content=make_rss(5, oldest_first=True),
+        ),
+    )
+    update_entries_for_feed(test_feed, session)
+    fan_out_feed_entries(test_feed.id, session)
+    document = FetchResult(
+        status_code=200,
+        content=make_rss(3, oldest_first=True),
+    )
+    mocked_fetch.return_value = document
+    update_entries_for_feed(test_feed, session)
+    mocker.patch("app.model_helpers.settings.feed_parse_max_entries", 1)
+
+    # only Item 3 is removed, Item 4 is gone from the document as well
+    # but it was stored last
+    assert prune_expired_feed_entries(session) == (1, 1)
+
+    # the same document parsed again stores nothing
+    test_feed.content_hash = None
+    assert update_entries_for_feed(test_feed, session) == 0
+    assert fan_out_feed_entries(test_feed.id, session) == 0
+    session.refresh(subscription)
+    assert len(subscription.user_feed_entries) == 4
+    assert subscription.unread_count == 4
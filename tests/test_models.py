@@ -0,0 +1,29 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.models import create_async_db_engine
+from settings import settings
+
+
+def test_async_engine_behind_pgbouncer(mocker):
+    mocker.patch.object(settings, "db_pgbouncer_transaction_pooling", True)
+    async_engine = create_async_db_engine()
+
+    async def run_queries():
+        results = []
+        async with async_engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            cache = raw_connection.driver_connection._stmt_cache
+            # each transaction may run on another server connection
+            for _ in range(2):
+                async with connection.begin():
+                    result = await connection.execute(select(1))
+                    results.append(result.scalar())
+        await async_engine.dispose()
+        return cache.get_max_size(), results
+
+    cache_size, results = asyncio.run(run_queries())
+
+    assert cache_size == 0
+    assert results == [1, 1]
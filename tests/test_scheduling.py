@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from app.scheduling import (
+    compute_poll_interval,
+    compute_retry_poll_at,
+    compute_unchanged_poll_interval,
+    get_max_age,
+    get_retry_after,
+)
+from settings import settings
+
+
+NOW = datetime(2024, 3, 11, 12, 0, tzinfo=timezone.utc)
+
+
+def hours_ago(*hours: int) -> list[datetime]:
+    return [NOW - timedelta(hours=hour) for hour in hours]
+
+
+def test_poll_interval_follows_publish_cadence():
+    interval = compute_poll_interval(hours_ago(0, 4, 8, 12), {}, {})
+    assert interval == 2 * 60 * 60
+
+
+def test_poll_interval_without_publish_dates():
+    interval = compute_poll_interval([None, None], {}, {})
+    assert interval == settings.feed_poll_default_interval_seconds
+
+
+def test_poll_interval_is_clamped():
+    assert compute_poll_interval(
+        hours_ago(0, 0, 0, 0) + [NOW - timedelta(seconds=1)], {}, {},
+    ) == settings.feed_poll_min_interval_seconds
+    assert compute_poll_interval(
+        [NOW - timedelta(days=365), NOW], {}, {},
+    ) == settings.feed_poll_max_interval_seconds
+
+
+def test_poll_interval_respects_feed_hints():
+    dates = hours_ago(0, 1, 2)
+
+    assert compute_poll_interval(dates, {"ttl": "180"}, {}) == 3 * 60 * 60
+    assert compute_poll_interval(
+        dates,
+        {"sy_updateperiod": "daily", "sy_updatefrequency": "4"},
+        {},
+    ) == 6 * 60 * 60
+    assert compute_poll_interval(
+        dates, {}, {"cache-control": "public, max-age=7200"},
+    ) == 2 * 60 * 60
+
+
+def test_unchanged_poll_interval():
+    assert compute_unchanged_poll_interval(None, {}) == (
+        settings.feed_poll_default_interval_seconds
+    )
+    assert compute_unchanged_poll_interval(
+        600, {"cache-control": "max-age=900"},
+    ) == 900
+
+
+def test_get_max_age():
+    assert get_max_age("public, max-age=60") == 60
+    assert get_max_age("s-maxage=60") is None
+    assert get_max_age("no-cache, max-age=60") is None
+    assert get_max_age(None) is None
+
+
+def test_get_retry_after():
+    assert get_retry_after("120", NOW) == 120
+    assert get_retry_after("Mon, 11 Mar 2024 12:10:00 GMT", NOW) == 600
+    assert get_retry_after("Mon, 11 Mar 2024 12:10:00 -0000", NOW) == 600
+    assert get_retry_after("soon", NOW) is None
+
+
+def test_retry_poll_at():
+    assert compute_retry_poll_at(NOW) == NOW + timedelta(
+        seconds=settings.feed_poll_error_interval_seconds,
+    )
+    assert compute_retry_poll_at(
+        NOW, {"retry-after": "60"},
+    ) == NOW + timedelta(seconds=60)
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+import httpx
+from sqlmodel import select
+
+from app.fetcher import FetchResult
+from app.locks import single_flight
+from app.models import Feed, FeedEntry, engine
+from app.scheduling import utc_now
+from app.tasks import (
+    claim_due_feeds,
+    dispatch_in_batches,
+    init_worker_process,
+    prune_feed_entries_task,
+    update_feeds,
+    update_feeds_batch_task,
+)
+from settings import settings
+from tests.mock_data import sample_parser_raw_data
+
+
+def test_update_feeds_skips_failing_feeds(
+    session, test_feed, fake_redis, mocker,
+):
+    broken_feed = Feed(
+        feed_url="https://broken.example.com/rss",
+        feed_title="Broken Feed",
+    )
+    unreachable_feed = Feed(
+        feed_url="https://unreachable.example.com/rss",
+        feed_title="Unreachable Feed",
+    )
+    session.add_all([broken_feed, unreachable_feed])
+    session.commit()
+
+    results_by_url = {
+        test_feed.feed_url: FetchResult(
+            status_code=200,
+            content=sample_parser_raw_data.encode(),
+        ),
+        broken_feed.feed_url: FetchResult(
+            status_code=200,
+            content=b"<html>not a feed",
+        ),
+        unreachable_feed.feed_url: httpx.HTTPStatusError(
+            "Service Unavailable",
+            request=httpx.Request("GET", unreachable_feed.feed_url),
+            response=httpx.Response(503, headers={"Retry-After": "60"}),
+        ),
+    }
+
+    async def fetch_feeds(feeds):
+        return [results_by_url[feed.feed_url] for feed in feeds]
+
+    mocker.patch("app.tasks.fetch_feeds", side_effect=fetch_feeds)
+    mocked_mark = mocker.patch("app.tasks.mark_feeds_refreshed")
+    mocked_fan_out = mocker.patch("app.tasks.fan_out_feed_changes_task.delay")
+
+    update_feeds(
+        [test_feed.id, broken_feed.id, unreachable_feed.id],
+        session,
+    )
+
+    statement = select(FeedEntry.feed_id)
+    assert set(session.exec(statement).all()) == {test_feed.id}
+    mocked_mark.assert_called_once()
+    mocked_fan_out.assert_called_once()
+
+    # failing feeds are retried later, the unreachable one when it asked to
+    now = utc_now()
+    assert test_feed.poll_interval_seconds
+    assert broken_feed.poll_interval_seconds is None
+    assert broken_feed.next_poll_at > now + timedelta(
+        seconds=settings.feed_poll_error_interval_seconds - 60,
+    )
+    assert unreachable_feed.next_poll_at < now + timedelta(seconds=61)
+
+
+def test_claim_due_feeds(session, test_feed):
+    now = utc_now()
+    later_feed = Feed(
+        feed_url="https://later.example.com/rss",
+        feed_title="Later Feed",
+        next_poll_at=now + timedelta(hours=1),
+    )
+    inactive_feed = Feed(
+        feed_url="https://inactive.example.com/rss",
+        feed_title="Inactive Feed",
+        is_active=False,
+    )
+    session.add_all([later_feed, inactive_feed])
+    session.commit()
+
+    assert claim_due_feeds(session, limit=10) == [test_feed.id]
+    # leased feeds are not dispatched again by the next beat run
+    assert claim_due_feeds(session, limit=10) == []
+
+    session.refresh(test_feed)
+    assert test_feed.next_poll_at > now + timedelta(
+        seconds=settings.feed_dispatch_lease_seconds - 60,
+    )
+
+
+
+def test_dispatch_in_batches(mocker):
+    mocked_group = mocker.patch("app.tasks.group")
+
+    dispatch_in_batches(update_feeds_batch_task, list(range(5)), 2)
+
+    signatures = list(mocked_group.call_args.args[0])
+    assert [signature.args for signature in signatures] == [
+        ([0, 1],), ([2, 3],), ([4],),
+    ]
+    mocked_group.return_value.apply_async.assert_called_once()
+
+    mocked_group.reset_mock()
+    dispatch_in_batches(update_feeds_batch_task, [], 2)
+    mocked_group.assert_not_called()
+
+
+def test_update_feeds_skips_locked_feeds(
+    session, test_feed, fake_redis, mocker,
+):
+    mocked_ingest = mocker.patch("app.tasks.ingest_feeds")
+
+    with single_flight(test_feed.id) as is_owner:
+        assert is_owner
+        update_feeds([test_feed.id], session)
+
+    mocked_ingest.assert_not_called()
+
+    # the lock is released once the other update is done
+    update_feeds([test_feed.id], session)
+    mocked_ingest.assert_called_once()
+    assert fake_redis.keys("feed-lock:*") == []
+
+
+def test_init_worker_process_replaces_pool():
+    inherited_pool = engine.pool
+
+    init_worker_process()
+
+    assert engine.pool is not inherited_pool
+
+
+def test_prune_feed_entries_task_reports(mocker):
+    mocker.patch("app.tasks.prune_expired_feed_entries", return_value=(3, 5))
+
+    report = prune_feed_entries_task()
+
+    assert report["removed_entries"] == 3
+    assert report["removed_user_entries"] == 5
+    assert report["seconds"] >= 0